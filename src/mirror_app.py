@@ -8,10 +8,17 @@ Supports multiple source printers mirroring to one destination.
 import sys
 import os
 import time
+
+# Taken before anything heavy is imported so --startup-benchmark can report
+# the full time-to-first-window.
+_STARTUP_T0 = time.perf_counter()
+
 import json
+import hashlib
 import logging
-import subprocess
-import base64
+import threading
+import importlib.util
+from collections import deque
 from typing import Set, Optional, List, Dict
 from pathlib import Path
 
@@ -20,15 +27,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-try:
-    import pywintypes  # noqa: F401 - Required for PyInstaller
-    import pythoncom  # noqa: F401 - Required for PyInstaller
-    import win32api  # noqa: F401 - Required for PyInstaller
-    import win32print
+# pywin32 is only needed once the window is up (printer list, mirroring,
+# admin check), so just probe for it here and import it on first use.
+WINDOWS_AVAILABLE = importlib.util.find_spec("win32print") is not None
+win32print = None
+
+
+def _load_win32print():
+    """Import win32print (and the modules PyInstaller needs with it) lazily."""
+    global win32print
+    if win32print is None:
+        import pywintypes  # noqa: F401 - Required for PyInstaller
+        import pythoncom  # noqa: F401 - Required for PyInstaller
+        import win32api  # noqa: F401 - Required for PyInstaller
+        import win32print as module
+
+        win32print = module
+    return win32print
 
-    WINDOWS_AVAILABLE = True
-except ImportError:
-    WINDOWS_AVAILABLE = False
 
 from PyQt6.QtWidgets import (
     QApplication,
@@ -47,11 +63,19 @@ from PyQt6.QtWidgets import (
     QListWidget,
     QListWidgetItem,
     QAbstractItemView,
+    QScrollArea,
+)
+from PyQt6.QtCore import Qt, pyqtSignal, QThread, QTimer, QPointF, QRectF
+from PyQt6.QtGui import (
+    QFont,
+    QTextCursor,
+    QIcon,
+    QPixmap,
+    QPainter,
+    QColor,
+    QPen,
+    QPolygonF,
 )
-from PyQt6.QtCore import Qt, pyqtSignal, QThread, QByteArray
-from PyQt6.QtGui import QFont, QTextCursor, QIcon, QPixmap
-from PyQt6.QtSvg import QSvgRenderer
-from PyQt6.QtCore import QBuffer
 
 
 # Emilia Flower Icon (PiFlower from Phosphor Icons) - Pink color
@@ -99,24 +123,236 @@ def save_config(config: dict):
         json.dump(config, f, indent=2)
 
 
+ICON_SIZES = [16, 32, 48, 64, 128, 256]
+ICON_CACHE_DIR = CONFIG_PATH.parent / "cache"
+
+_app_icon: Optional[QIcon] = None
+
+
+def _icon_cache_path(size: int) -> Path:
+    # Keyed on the SVG source so a new icon invalidates old renders.
+    digest = hashlib.sha1(FLOWER_ICON_SVG.encode()).hexdigest()[:12]
+    return ICON_CACHE_DIR / f"flower-{digest}-{size}.png"
+
+
+def _render_icon(size: int) -> QPixmap:
+    """Render the flower SVG at the given size (imports QtSvg on demand)."""
+    from PyQt6.QtCore import QByteArray
+    from PyQt6.QtGui import QPainter
+    from PyQt6.QtSvg import QSvgRenderer
+
+    renderer = QSvgRenderer(QByteArray(FLOWER_ICON_SVG.encode()))
+    pixmap = QPixmap(size, size)
+    pixmap.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(pixmap)
+    renderer.render(painter)
+    painter.end()
+    return pixmap
+
+
+def get_icon_pixmap(size: int) -> QPixmap:
+    """Load the icon at one size from the disk cache, rendering it on a miss."""
+    path = _icon_cache_path(size)
+    pixmap = QPixmap(str(path))
+    if not pixmap.isNull():
+        return pixmap
+
+    pixmap = _render_icon(size)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".part")
+        if pixmap.save(str(tmp_path), "PNG"):
+            os.replace(tmp_path, path)
+    except OSError:
+        pass
+    return pixmap
+
+
 def get_app_icon() -> QIcon:
-    """Create QIcon from embedded SVG."""
-    svg_bytes = QByteArray(FLOWER_ICON_SVG.encode())
-    renderer = QSvgRenderer(svg_bytes)
-
-    # Create pixmap at different sizes for the icon
-    icon = QIcon()
-    for size in [16, 32, 48, 64, 128, 256]:
-        pixmap = QPixmap(size, size)
-        pixmap.fill(Qt.GlobalColor.transparent)
-        from PyQt6.QtGui import QPainter
-
-        painter = QPainter(pixmap)
-        renderer.render(painter)
-        painter.end()
-        icon.addPixmap(pixmap)
+    """Create QIcon from the cached renders of the embedded SVG."""
+    global _app_icon
+    if _app_icon is None:
+        icon = QIcon()
+        for size in ICON_SIZES:
+            icon.addPixmap(get_icon_pixmap(size))
+        _app_icon = icon
+    return _app_icon
+
+
+class ThroughputHistory:
+    """Per-source throughput time series in fixed-size ring buffers.
+
+    Time is cut into `bucket`-second slots and each source keeps its last
+    `capacity` slots as [jobs copied, bytes copied, jobs waiting, highest
+    lag]. Written by the mirror thread, read by the dashboard; `version`
+    changes on every write so readers can skip redraws when nothing moved.
+    """
+
+    def __init__(self, capacity: int = 120, bucket: float = 5.0):
+        self.capacity = capacity
+        self.bucket = bucket
+        self.version = 0
+        self._series: Dict[str, deque] = {}
+        self._slot = self.slot()
+        self._lock = threading.Lock()
+
+    def slot(self) -> int:
+        return int(time.monotonic() // self.bucket)
+
+    def _advance(self):
+        """Open empty slots for the time passed; queue depth carries over."""
+        slot = self.slot()
+        gap = min(slot - self._slot, self.capacity)
+        if gap <= 0:
+            return
+        self._slot = slot
+        for series in self._series.values():
+            depth = series[-1][2]
+            for _ in range(gap):
+                series.append([0, 0, depth, 0.0])
+
+    def _current(self, source: str) -> list:
+        series = self._series.get(source)
+        if series is None:
+            series = self._series[source] = deque(
+                [[0, 0, 0, 0.0]], maxlen=self.capacity
+            )
+        return series[-1]
+
+    def add_job(self, source: str, size: int, lag: float):
+        with self._lock:
+            self._advance()
+            current = self._current(source)
+            current[0] += 1
+            current[1] += size
+            current[3] = max(current[3], lag)
+            self.version += 1
+
+    def set_depth(self, source: str, depth: int):
+        with self._lock:
+            self._advance()
+            current = self._current(source)
+            if current[2] != depth:
+                current[2] = depth
+                self.version += 1
+
+    def snapshot(self) -> Dict[str, List[list]]:
+        """Copy of every source's slots, oldest first."""
+        with self._lock:
+            self._advance()
+            return {
+                source: [list(slot) for slot in series]
+                for source, series in self._series.items()
+            }
+
+
+def _format_bytes(count: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+
+class ThroughputDashboard(QWidget):
+    """One row of sparkline charts per source, drawn from a ThroughputHistory.
+
+    A timer checks the history every `redraw_ms` and repaints only when it
+    changed or a new time slot began, and only the rows on screen are
+    painted, so many sources stay cheap.
+    """
+
+    ROW_HEIGHT = 46
+    NAME_WIDTH = 150
+    # (slot field, line color): jobs/min, bytes/s, queue depth, lag
+    CHARTS = ((0, "#E91E63"), (1, "#3F51B5"), (2, "#FF9800"), (3, "#4CAF50"))
+
+    def __init__(self, history: ThroughputHistory, redraw_ms: int = 500, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self._drawn = (-1, -1)
+        self._sources = 0
+        self.setMinimumHeight(self.ROW_HEIGHT)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self._tick)
+        self.timer.start(redraw_ms)
+
+    def _tick(self):
+        state = (self.history.version, self.history.slot())
+        if state != self._drawn and self.isVisible():
+            self.update()
+
+    def _summary(self, field: int, slots: List[list]) -> str:
+        """The figure printed on a chart: the last minute, or the latest depth."""
+        recent = slots[-max(1, int(60 / self.history.bucket)) :]
+        seconds = len(recent) * self.history.bucket
+        if field == 0:
+            return f"{sum(s[0] for s in recent) * 60 / seconds:.1f} jobs/min"
+        if field == 1:
+            return f"{_format_bytes(sum(s[1] for s in recent) / seconds)}/s"
+        if field == 2:
+            return f"{slots[-1][2]} queued"
+        return f"{max(s[3] for s in recent):.1f}s lag"
+
+    def paintEvent(self, event):
+        self._drawn = (self.history.version, self.history.slot())
+        series = self.history.snapshot()
+        if len(series) != self._sources:
+            self._sources = len(series)
+            self.setMinimumHeight(max(1, len(series)) * self.ROW_HEIGHT)
+
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if not series:
+            painter.setPen(QColor("gray"))
+            painter.drawText(
+                self.rect(),
+                Qt.AlignmentFlag.AlignCenter,
+                "Throughput appears here while the mirror runs",
+            )
+            painter.end()
+            return
 
-    return icon
+        visible = event.rect()
+        chart_width = (self.width() - self.NAME_WIDTH) / len(self.CHARTS)
+        capacity = self.history.capacity
+        for row, source in enumerate(sorted(series)):
+            top = row * self.ROW_HEIGHT
+            if top + self.ROW_HEIGHT < visible.top() or top > visible.bottom():
+                continue
+            slots = series[source]
+            painter.setPen(QColor("black"))
+            painter.drawText(
+                QRectF(4, top, self.NAME_WIDTH - 8, self.ROW_HEIGHT),
+                Qt.AlignmentFlag.AlignVCenter | Qt.AlignmentFlag.AlignLeft,
+                source,
+            )
+            for index, (field, color) in enumerate(self.CHARTS):
+                cell = QRectF(
+                    self.NAME_WIDTH + index * chart_width + 2,
+                    top + 2,
+                    chart_width - 4,
+                    self.ROW_HEIGHT - 4,
+                )
+                painter.fillRect(cell, QColor("#f5f5f5"))
+                values = [slot[field] for slot in slots]
+                peak = max(values) or 1
+                step = cell.width() / max(1, capacity - 1)
+                # Newest slot at the right edge, older ones to its left
+                x0 = cell.right() - (len(values) - 1) * step
+                points = [
+                    QPointF(x0 + i * step, cell.bottom() - v / peak * (cell.height() - 14))
+                    for i, v in enumerate(values)
+                ]
+                painter.setPen(QPen(QColor(color), 1.5))
+                painter.drawPolyline(QPolygonF(points))
+                painter.setPen(QColor("#333333"))
+                painter.drawText(
+                    cell.adjusted(4, 1, -4, 0),
+                    Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft,
+                    self._summary(field, slots),
+                )
+        painter.end()
 
 
 class MirrorWorker(QThread):
@@ -127,12 +363,17 @@ class MirrorWorker(QThread):
     job_copied = pyqtSignal(str, str, int)
 
     def __init__(
-        self, source_printers: List[str], dest_printer: str, interval: float = 1.0
+        self,
+        source_printers: List[str],
+        dest_printer: str,
+        interval: float = 1.0,
+        history: Optional[ThroughputHistory] = None,
     ):
         super().__init__()
         self.source_printers = source_printers
         self.dest_printer = dest_printer
         self.interval = interval
+        self.history = history
         self.running = False
         self.processed_jobs: Dict[str, Set[int]] = {p: set() for p in source_printers}
         self.spool_dir = os.path.join(
@@ -193,8 +434,17 @@ class MirrorWorker(QThread):
 
         return None
 
-    def _copy_job(self, source_printer: str, job_id: int, document_name: str) -> bool:
-        """Copy a job to the destination printer."""
+    def _copy_job(
+        self,
+        source_printer: str,
+        job_id: int,
+        document_name: str,
+        detected: Optional[float] = None,
+    ) -> bool:
+        """Copy a job to the destination printer.
+
+        `detected` is when the job was first seen, for the lag chart.
+        """
         try:
             spool_data = self._read_spool_data(job_id)
 
@@ -217,6 +467,9 @@ class MirrorWorker(QThread):
                     f"OK! [{source_printer}] Job {job_id} -> {self.dest_printer} (ID: {new_job_id}, {len(spool_data)} bytes)"
                 )
                 self.job_copied.emit(source_printer, self.dest_printer, job_id)
+                if self.history is not None:
+                    lag = time.monotonic() - detected if detected else 0.0
+                    self.history.add_job(source_printer, len(spool_data), lag)
                 return True
             finally:
                 win32print.ClosePrinter(handle)
@@ -251,6 +504,7 @@ class MirrorWorker(QThread):
         """Run the mirror service for multiple source printers."""
         self.running = True
         self.status_changed.emit("running")
+        _load_win32print()
 
         sources_str = ", ".join(self.source_printers)
         self.log(f"Mirror started: [{sources_str}] -> {self.dest_printer}")
@@ -277,22 +531,30 @@ class MirrorWorker(QThread):
                 current_jobs = self._get_current_jobs(printer)
                 new_job_ids = set(current_jobs.keys()) - self.processed_jobs[printer]
 
+                # Only jobs still to be copied count as queued: printed jobs
+                # stay in the source queue and our own copies are skipped
+                waiting = []
                 for job_id in sorted(new_job_ids):
+                    if current_jobs[job_id]["document"].startswith("[MIRROR"):
+                        self.processed_jobs[printer].add(job_id)
+                    else:
+                        waiting.append(job_id)
+                if self.history is not None:
+                    self.history.set_depth(printer, len(waiting))
+
+                for index, job_id in enumerate(waiting):
                     if not self.running:
                         break
 
-                    job_info = current_jobs[job_id]
-                    document = job_info["document"]
-
-                    if document.startswith("[MIRROR"):
-                        self.processed_jobs[printer].add(job_id)
-                        continue
-
+                    document = current_jobs[job_id]["document"]
                     self.log(f">>> [{printer}] New job: [{job_id}] {document}")
+                    detected = time.monotonic()
                     time.sleep(1.0)
 
-                    self._copy_job(printer, job_id, document)
+                    self._copy_job(printer, job_id, document, detected)
                     self.processed_jobs[printer].add(job_id)
+                    if self.history is not None:
+                        self.history.set_depth(printer, len(waiting) - index - 1)
 
                 self.processed_jobs[printer] &= set(current_jobs.keys())
 
@@ -313,16 +575,30 @@ class PrinterMirrorApp(QMainWindow):
         self.worker = None
         self.printers = []
         self.config = load_config()
+        # Outlives the worker so the charts keep the previous run's history
+        self.history = ThroughputHistory()
 
         self._setup_ui()
+
+        # Printer enumeration and the service query can take a noticeable
+        # time on busy spoolers, so do them once the window is on screen.
+        QTimer.singleShot(0, self._deferred_startup)
+
+    def _deferred_startup(self):
+        """Finish startup work that does not need to block the first paint."""
         self._load_printers()
         self._apply_saved_config()
 
+        if WINDOWS_AVAILABLE:
+            self._check_service_status()
+            # Only reads the service's status files, cheap enough to poll
+            self.health_timer = QTimer(self)
+            self.health_timer.timeout.connect(self._check_service_health)
+            self.health_timer.start(15000)
+
         # Auto-start if configured
         if self.config.get("auto_start", False):
             # Use a timer to start after UI is ready
-            from PyQt6.QtCore import QTimer
-
             QTimer.singleShot(500, self._auto_start_mirror)
 
     def _setup_ui(self):
@@ -343,16 +619,7 @@ class PrinterMirrorApp(QMainWindow):
 
         # Logo
         logo_label = QLabel()
-        svg_bytes = QByteArray(FLOWER_ICON_SVG.encode())
-        renderer = QSvgRenderer(svg_bytes)
-        pixmap = QPixmap(48, 48)
-        pixmap.fill(Qt.GlobalColor.transparent)
-        from PyQt6.QtGui import QPainter
-
-        painter = QPainter(pixmap)
-        renderer.render(painter)
-        painter.end()
-        logo_label.setPixmap(pixmap)
+        logo_label.setPixmap(get_icon_pixmap(48))
         header_layout.addWidget(logo_label)
 
         # Title
@@ -473,6 +740,15 @@ class PrinterMirrorApp(QMainWindow):
         self.service_status_label.setStyleSheet("font-weight: bold; padding: 5px;")
         service_layout.addWidget(self.service_status_label)
 
+        # SLO warnings reported by the running service
+        self.service_health_label = QLabel()
+        self.service_health_label.setWordWrap(True)
+        self.service_health_label.setStyleSheet(
+            "font-weight: bold; color: #d32f2f; padding: 5px;"
+        )
+        self.service_health_label.hide()
+        service_layout.addWidget(self.service_health_label)
+
         # Service buttons
         service_btn_layout = QHBoxLayout()
 
@@ -538,6 +814,19 @@ class PrinterMirrorApp(QMainWindow):
         self.status_label.setStyleSheet("font-weight: bold; padding: 5px;")
         layout.addWidget(self.status_label)
 
+        # === Throughput ===
+        dashboard_group = QGroupBox("Throughput (last 10 minutes)")
+        dashboard_layout = QVBoxLayout(dashboard_group)
+        self.dashboard = ThroughputDashboard(self.history)
+        dashboard_scroll = QScrollArea()
+        dashboard_scroll.setWidget(self.dashboard)
+        dashboard_scroll.setWidgetResizable(True)
+        dashboard_scroll.setFrameShape(QScrollArea.Shape.NoFrame)
+        dashboard_scroll.setMinimumHeight(ThroughputDashboard.ROW_HEIGHT * 2)
+        dashboard_scroll.setMaximumHeight(ThroughputDashboard.ROW_HEIGHT * 4)
+        dashboard_layout.addWidget(dashboard_scroll)
+        layout.addWidget(dashboard_group)
+
         # === Log ===
         log_group = QGroupBox("Activity Log")
         log_layout = QVBoxLayout(log_group)
@@ -559,10 +848,6 @@ class PrinterMirrorApp(QMainWindow):
         self._log("Select source printer(s) and destination, then press 'Start Mirror'")
         self._log("-" * 60)
 
-        # Check service status on startup
-        if WINDOWS_AVAILABLE:
-            self._check_service_status()
-
     def _log(self, message: str):
         """Add message to log."""
         timestamp = time.strftime("%H:%M:%S")
@@ -579,6 +864,7 @@ class PrinterMirrorApp(QMainWindow):
             return
 
         try:
+            _load_win32print()
             flags = win32print.PRINTER_ENUM_LOCAL | win32print.PRINTER_ENUM_CONNECTIONS
             printers = win32print.EnumPrinters(flags, None, 2)
 
@@ -661,6 +947,8 @@ class PrinterMirrorApp(QMainWindow):
 
     def _configure_printer(self, printer_name: str):
         """Configure printer to keep printed jobs."""
+        import subprocess
+
         try:
             cmd = f'Set-Printer -Name "{printer_name}" -KeepPrintedJobs $true'
             result = subprocess.run(
@@ -708,7 +996,7 @@ class PrinterMirrorApp(QMainWindow):
                 self._configure_printer(source)
 
         interval = self.interval_spin.value()
-        self.worker = MirrorWorker(sources, dest, interval)
+        self.worker = MirrorWorker(sources, dest, interval, self.history)
         self.worker.log_message.connect(self._log)
         self.worker.status_changed.connect(self._on_status_changed)
         self.worker.start()
@@ -769,6 +1057,8 @@ class PrinterMirrorApp(QMainWindow):
 
     def _check_service_status(self):
         """Check if the service is installed and running."""
+        import subprocess
+
         try:
             result = subprocess.run(
                 ["sc", "query", SERVICE_NAME],
@@ -777,6 +1067,7 @@ class PrinterMirrorApp(QMainWindow):
             )
             if result.returncode == 0:
                 output = result.stdout
+                self._check_service_health()
                 if "RUNNING" in output:
                     self.service_status_label.setText("Service: ● Running")
                     self.service_status_label.setStyleSheet(
@@ -819,6 +1110,30 @@ class PrinterMirrorApp(QMainWindow):
             self.service_status_label.setText(f"Service: Error checking status")
             self._log(f"Error checking service status: {e}")
 
+    def _check_service_health(self):
+        """Show SLO violations the running service wrote to status.json."""
+        problems = []
+        for status_file in sorted(SERVICE_CONFIG_DIR.glob("status*.json")):
+            try:
+                with open(status_file, "r") as f:
+                    status = json.load(f)
+            except (OSError, ValueError):
+                continue
+            # Left behind by a service that is no longer running
+            if time.time() - status.get("updated", 0) > 60:
+                continue
+            slo = status.get("slo")
+            if slo and slo.get("state") == "violated":
+                problems.append(slo.get("last_violation") or "SLO violated")
+
+        if problems:
+            self.service_health_label.setText(
+                "\n".join(f"⚠ SLO: {problem}" for problem in problems)
+            )
+            self.service_health_label.show()
+        else:
+            self.service_health_label.hide()
+
     def _save_service_config(self):
         """Save current configuration for the service."""
         sources = self._get_selected_sources()
@@ -835,11 +1150,21 @@ class PrinterMirrorApp(QMainWindow):
             QMessageBox.warning(self, "Error", "Destination cannot be a source printer")
             return False
 
-        config = {
-            "source_printers": sources,
-            "dest_printer": dest,
-            "interval": interval,
-        }
+        # Keep advanced settings (fallbacks, breaker, ...) edited by hand
+        config = {}
+        if SERVICE_CONFIG_PATH.exists():
+            try:
+                with open(SERVICE_CONFIG_PATH, "r") as f:
+                    config = json.load(f)
+            except Exception:
+                config = {}
+        config.update(
+            {
+                "source_printers": sources,
+                "dest_printer": dest,
+                "interval": interval,
+            }
+        )
 
         try:
             SERVICE_CONFIG_DIR.mkdir(parents=True, exist_ok=True)
@@ -854,6 +1179,8 @@ class PrinterMirrorApp(QMainWindow):
 
     def _install_service(self):
         """Install the Windows service."""
+        import subprocess
+
         # First save configuration
         if not self._save_service_config():
             return
@@ -943,6 +1270,8 @@ class PrinterMirrorApp(QMainWindow):
 
     def _uninstall_service(self):
         """Uninstall the Windows service."""
+        import subprocess
+
         reply = QMessageBox.question(
             self,
             "Confirm",
@@ -997,6 +1326,8 @@ class PrinterMirrorApp(QMainWindow):
 
     def _start_service(self):
         """Start the Windows service."""
+        import subprocess
+
         installed_exe = SERVICE_INSTALL_DIR / "EmiliaMirrorService.exe"
         try:
             if installed_exe.exists():
@@ -1021,6 +1352,8 @@ class PrinterMirrorApp(QMainWindow):
 
     def _stop_service(self):
         """Stop the Windows service."""
+        import subprocess
+
         installed_exe = SERVICE_INSTALL_DIR / "EmiliaMirrorService.exe"
         try:
             if installed_exe.exists():
@@ -1061,32 +1394,78 @@ class PrinterMirrorApp(QMainWindow):
             event.accept()
 
 
+def _check_admin():
+    """Warn when not elevated; spool files are unreadable otherwise."""
+    import ctypes
+
+    try:
+        is_admin = ctypes.windll.shell32.IsUserAnAdmin() != 0  # type: ignore
+        if not is_admin:
+            QMessageBox.warning(
+                None,
+                "Warning",
+                "It is recommended to run as Administrator\nto access spool files.",
+            )
+    except:
+        pass
+
+
+# Default --startup-benchmark budget for time-to-first-window, in ms
+STARTUP_BUDGET_MS = 1500
+
+
+def _startup_benchmark(app: QApplication, marks: Dict[str, float], budget_ms: float):
+    """Report startup phases once the first window is painted; exit 1 if slow."""
+
+    def finish():
+        # Force the pending paint so the mark covers a fully drawn window
+        for widget in app.topLevelWidgets():
+            if widget.isVisible():
+                widget.repaint()
+        marks["first window"] = time.perf_counter()
+        previous = _STARTUP_T0
+        for phase, stamp in marks.items():
+            print(f"{phase:<16} {(stamp - previous) * 1000:8.1f} ms")
+            previous = stamp
+        total_ms = (marks["first window"] - _STARTUP_T0) * 1000
+        verdict = "OK" if total_ms <= budget_ms else "REGRESSION"
+        print(f"{'total':<16} {total_ms:8.1f} ms (budget {budget_ms:.0f} ms) {verdict}")
+        app.exit(0 if total_ms <= budget_ms else 1)
+
+    # Registered before the window exists so it runs ahead of the window's
+    # own deferred startup work on the first event-loop pass.
+    QTimer.singleShot(0, finish)
+
+
 def main():
+    benchmark_ms = None
+    if "--startup-benchmark" in sys.argv:
+        index = sys.argv.index("--startup-benchmark")
+        try:
+            benchmark_ms = float(sys.argv[index + 1])
+        except (IndexError, ValueError):
+            benchmark_ms = STARTUP_BUDGET_MS
+    marks = {"imports": time.perf_counter()}
+
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
     app.setApplicationName(APP_NAME)
 
     # Set app icon
     app.setWindowIcon(get_app_icon())
+    marks["application"] = time.perf_counter()
 
-    # Check admin
-    if WINDOWS_AVAILABLE:
-        import ctypes
-
-        try:
-            is_admin = ctypes.windll.shell32.IsUserAnAdmin() != 0  # type: ignore
-            if not is_admin:
-                QMessageBox.warning(
-                    None,
-                    "Warning",
-                    "It is recommended to run as Administrator\nto access spool files.",
-                )
-        except:
-            pass
+    if benchmark_ms is not None:
+        _startup_benchmark(app, marks, benchmark_ms)
 
     window = PrinterMirrorApp()
+    marks["window built"] = time.perf_counter()
     window.show()
 
+    if benchmark_ms is None and WINDOWS_AVAILABLE:
+        # Check admin once the window is visible
+        QTimer.singleShot(0, _check_admin)
+
     sys.exit(app.exec())
 
 
@@ -10,7 +10,24 @@ import os
 import time
 import json
 import logging
-from typing import Set, Optional, List, Dict
+import logging.handlers
+import asyncio
+import bisect
+import hashlib
+import hmac
+import itertools
+import multiprocessing
+import queue
+import re
+import socket
+import select
+import ssl
+import threading
+import zlib
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Set, Optional, List, Dict, Tuple, Iterator, Callable, Iterable
 from pathlib import Path
 
 APP_NAME = "Emilia Print Mirror"
@@ -21,6 +38,134 @@ DEFAULT_CONFIG = {
     "source_printers": ["EmiliaCloudPrinterEpsonOrg"],
     "dest_printer": "EmiliaCloudPrinterEpsonCopy",
     "interval": 1.0,
+    # Tried in order while the destination's circuit breaker is open
+    "fallback_printers": [],
+    "breaker_threshold": 3,
+    "breaker_reset": 30.0,
+    # Scheduling within one scan: sources are served round-robin
+    "shortest_job_first": False,
+    "max_scan_seconds": 10.0,
+    # Spool bytes buffered across all in-progress copies
+    "memory_budget_mb": 64,
+    # Larger jobs are streamed in chunks instead of read whole
+    "stream_threshold_mb": 8,
+    # Spool formats never mirrored (see sniff_spool_format)
+    "skip_formats": ["xps"],
+    # Periodic CPU/allocation dumps to PROFILE_DIR (also: `profile` command)
+    "profile": False,
+    "profile_interval": 300.0,
+    # Non-spooler destinations by name, e.g.
+    # {"KitchenTCP": {"type": "tcp", "host": "192.168.1.50", "port": 9100}}
+    # {"Audit": {"type": "directory", "path": "D:\\PrintAudit", "compress": true}}
+    # {"Feed": {"type": "pipe", "path": "\\\\.\\pipe\\emilia-feed"}}
+    # {"HQ": {"type": "relay", "host": "hq.example.com", "token": "..."}}
+    # dest_printer / fallback_printers names not listed here are printers.
+    "destinations": {},
+    # Extra destinations that receive a copy of every job (e.g. an audit dir)
+    "capture_to": [],
+    # Accept jobs sent straight to this machine (raw 9100 / LPD 515)
+    "ingest": {
+        "enabled": False,
+        "host": "0.0.0.0",
+        "raw_port": 9100,
+        "lpd_port": 515,
+        "queue_size": 16,
+        "workers": 2,
+        "idle_timeout": 5.0,
+        "max_job_mb": 32,
+        # Memory reserved up front per raw connection (grown if needed), and
+        # how long a connection waits for memory before it is dropped
+        "raw_reserve_mb": 1,
+        "budget_wait": 30.0,
+    },
+    # Print jobs sent by "relay" destinations at other sites
+    "relay_receiver": {
+        "enabled": False,
+        "host": "0.0.0.0",
+        "port": 9700,
+        "token": "",
+        "max_batch_mb": 64,
+        # Jobs that can never print here (no destination takes their
+        # datatype, or a skipped format); default: <relay dir>\dead-letter
+        "dead_letter_dir": "",
+        # Certificate (PEM) and key to accept TLS connections only
+        "tls_cert": "",
+        "tls_key": "",
+    },
+    # "thread": classic polling loop; "async": asyncio engine (fast stop)
+    "engine": "thread",
+    "async_workers": 4,
+    "stop_timeout": 5.0,
+    # >1: split source_printers across this many worker processes
+    "workers": 1,
+    # Adaptive polling: idle sources back off from `interval` up to
+    # `max_interval` (0 = always poll every `interval`)
+    "max_interval": 0,
+    "poll_backoff": 2.0,
+    # Per-source overrides, e.g. {"BarPrinter": {"interval": 2, "max_interval": 60}}
+    "source_overrides": {},
+    # Delete mirrored jobs from source queues (KeepPrintedJobs keeps them all)
+    "retention": {
+        "enabled": False,
+        "max_age_minutes": 60,
+        "max_jobs": 200,
+        "only_printed": True,
+        "interval": 60.0,
+        "batch_size": 20,
+        "batch_pause": 0.5,
+    },
+    # Hold new jobs (they stay in the source queue) while the destination
+    # queue has `high_watermark` jobs or more, until it drains to
+    # `low_watermark`; only printer destinations report a queue depth
+    "backpressure": {
+        "enabled": False,
+        "high_watermark": 20,
+        "low_watermark": 5,
+        "check_interval": 2.0,
+    },
+    # Service-level objectives: a scan (checking the source queues) slower
+    # than `scan_seconds` (0 = interval) or a job mirrored more than
+    # `job_lag_seconds` after it was printed is logged, counted, reported to
+    # the event log and flagged in status.json
+    "slo": {
+        "enabled": True,
+        "scan_seconds": 0,
+        "job_lag_seconds": 60.0,
+        "alert_interval": 300.0,
+        "clear_after": 300.0,
+        "event_log": True,
+    },
+    # Active/standby: only the node holding the leader lock at `path` (a
+    # file on a share both machines reach) mirrors. "lease" renews a lease
+    # file; "file" holds an OS lock on it. See README
+    "ha": {
+        "enabled": False,
+        "lock": "lease",
+        "path": "",
+        "node": "",
+        "lease_seconds": 30.0,
+    },
+    # Enumerate source queues on this many threads; a queue that does not
+    # answer within `enum_timeout` seconds is skipped for that scan
+    "enum_workers": 8,
+    "enum_timeout": 5.0,
+    # Rewrite jobs on their way to the destinations, e.g.
+    # [{"type": "escpos", "copy_marker": "*** COPY ***", "strip_drawer": true}]
+    "transforms": [],
+    # Drop jobs before reading them, e.g. {"owners": ["svc-reports"],
+    # "document_regex": "^Test Page", "max_size_mb": 50}; see README
+    "filters": {},
+    # Start copying jobs that are still spooling, following the spool file
+    # as it grows; give up if it stops growing for `tail_stall_timeout` s
+    "tail_follow": False,
+    "tail_poll": 0.2,
+    "tail_stall_timeout": 30.0,
+    # Several independent mirrors in one service, e.g.
+    # {"kitchen": {"source_printers": [...], "dest_printer": "...", "weight": 2}}
+    # Each entry overrides the settings above; copies share a pool of
+    # `pipeline_workers` threads, handed out by weight
+    "pipelines": {},
+    "pipeline_workers": 4,
 }
 
 CONFIG_PATH = (
@@ -33,222 +178,4192 @@ LOG_PATH = (
     / "EmiliaPrintMirror"
     / "service.log"
 )
+STATUS_PATH = (
+    Path(os.environ.get("PROGRAMDATA", "C:\\ProgramData"))
+    / "EmiliaPrintMirror"
+    / "status.json"
+)
+PROFILE_DIR = (
+    Path(os.environ.get("PROGRAMDATA", "C:\\ProgramData"))
+    / "EmiliaPrintMirror"
+    / "profile"
+)
+RELAY_DIR = (
+    Path(os.environ.get("PROGRAMDATA", "C:\\ProgramData"))
+    / "EmiliaPrintMirror"
+    / "relay"
+)
+
+
+def get_config() -> dict:
+    """Read configuration from file."""
+    if CONFIG_PATH.exists():
+        try:
+            with open(CONFIG_PATH, "r") as f:
+                config = json.load(f)
+                # Handle legacy single source_printer config
+                if "source_printer" in config and "source_printers" not in config:
+                    config["source_printers"] = [config["source_printer"]]
+                return {**DEFAULT_CONFIG, **config}
+        except:
+            pass
+    return DEFAULT_CONFIG
+
+
+def save_config(config: dict):
+    """Save configuration to file."""
+    CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with open(CONFIG_PATH, "w") as f:
+        json.dump(config, f, indent=2)
+
+
+# Bytes read from the start of a spool file to classify it
+SNIFF_BYTES = 512
+
+# Datatype used when resubmitting each spool format (None = cannot mirror)
+SPOOL_DATATYPES = {
+    "raw": "RAW",
+    "escpos": "RAW",
+    "pcl": "RAW",
+    "postscript": "RAW",
+    "emf": "NT EMF 1.008",
+    "xps": None,
+}
+
+
+def sniff_spool_format(header: bytes) -> str:
+    """Classify a spool file from its first bytes.
+
+    Returns one of the SPOOL_DATATYPES keys. Anything unrecognised is
+    treated as printer-ready "raw" data.
+    """
+    if header[:4] == b"\x00\x00\x01\x00":
+        # EMF spool file (MS-EMFSPOOL header record, version 0x10000)
+        return "emf"
+    if header[:4] == b"\x01\x00\x00\x00" and header[40:44] == b" EMF":
+        return "emf"
+    if header[:4] == b"PK\x03\x04":
+        return "xps"
+
+    data = header.lstrip(b"\x04")
+    if data.startswith(b"\x1b%-12345X"):
+        # PJL job: the ENTER LANGUAGE command names the payload
+        upper = data.upper()
+        if b"LANGUAGE=POSTSCRIPT" in upper or b"%!PS" in upper:
+            return "postscript"
+        return "pcl"
+    if data.startswith(b"%!"):
+        return "postscript"
+    if data.startswith(b") HP-PCL XL"):
+        return "pcl"
+    if data.startswith(b"\x1bE\x1b") or data.startswith(b"\x1b&"):
+        return "pcl"
+    if data[:1] in (b"\x1b", b"\x1d", b"\x1c"):
+        # ESC @ (initialize) and other ESC/GS/FS commands lead receipts
+        return "escpos"
+    return "raw"
+
+
+try:
+    import win32serviceutil
+    import win32service
+    import win32event
+    import servicemanager
+    import win32print
+
+    SERVICE_AVAILABLE = True
+except ImportError:
+    SERVICE_AVAILABLE = False
+
+
+class PrinterSink:
+    """Destination that submits jobs through the local Windows spooler."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def accepts(self, datatype: str) -> bool:
+        return True
+
+    def queue_depth(self) -> Optional[int]:
+        """Number of jobs waiting in the printer's queue."""
+        handle = win32print.OpenPrinter(self.name)
+        try:
+            return win32print.GetPrinter(handle, 2)["cJobs"]
+        finally:
+            win32print.ClosePrinter(handle)
+
+    def send(
+        self,
+        doc_name: str,
+        chunks: Iterable[bytes],
+        datatype: str = "RAW",
+        source: str = "",
+        job_id: int = 0,
+    ) -> str:
+        """Submit spool data to the printer. Returns the new job id."""
+        handle = win32print.OpenPrinter(self.name)
+        try:
+            doc_info = (doc_name, "", datatype)
+            new_job_id = win32print.StartDocPrinter(handle, 1, doc_info)
+            try:
+                win32print.StartPagePrinter(handle)
+                for chunk in chunks:
+                    win32print.WritePrinter(handle, chunk)
+                win32print.EndPagePrinter(handle)
+            except BaseException:
+                # Don't let a half-written job print
+                win32print.AbortPrinter(handle)
+                raise
+            win32print.EndDocPrinter(handle)
+            return str(new_job_id)
+        finally:
+            win32print.ClosePrinter(handle)
+
+    def close(self):
+        pass
+
+
+class RawTcpSink:
+    """Destination that streams RAW jobs to a network printer's raw port.
+
+    The connection is kept open between jobs (JetDirect printers accept
+    back-to-back jobs on one socket) and dropped after `idle_timeout`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int = 9100,
+        timeout: float = 10.0,
+        idle_timeout: float = 30.0,
+        keepalive: bool = True,
+    ):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.sock: Optional[socket.socket] = None
+        self.last_used = 0.0
+        self.jobs_sent = 0
+        self._lock = threading.Lock()
+
+    def accepts(self, datatype: str) -> bool:
+        return datatype == "RAW"
+
+    def queue_depth(self) -> Optional[int]:
+        return None
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            if hasattr(socket, "SIO_KEEPALIVE_VALS"):
+                # Windows: probe after 30s idle, then every 5s
+                sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, 30000, 5000))
+        return sock
+
+    def _usable(self) -> bool:
+        """Check that the kept-open connection was not closed by the printer."""
+        if self.sock is None:
+            return False
+        if time.monotonic() - self.last_used > self.idle_timeout:
+            return False
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+            # Printers only talk back on close (EOF) or with status bytes
+            return not readable or self.sock.recv(4096, socket.MSG_PEEK) != b""
+        except OSError:
+            return False
+
+    def send(
+        self,
+        doc_name: str,
+        chunks: Iterable[bytes],
+        datatype: str = "RAW",
+        source: str = "",
+        job_id: int = 0,
+    ) -> str:
+        with self._lock:
+            if not self._usable():
+                self._drop()
+                self.sock = self._connect()
+            try:
+                for chunk in chunks:
+                    self.sock.sendall(chunk)
+            except BaseException:
+                # The printer has part of a job; a new connection ends it so
+                # the next job does not get appended to it
+                self._drop()
+                raise
+            self.last_used = time.monotonic()
+            self.jobs_sent += 1
+            return f"{self.host}:{self.port}#{self.jobs_sent}"
+
+    def _drop(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self.sock = None
+
+    def close(self):
+        if self._lock.acquire(timeout=1.0):
+            try:
+                self._drop()
+            finally:
+                self._lock.release()
+            return
+        # A send is still writing; shutting the socket down makes it fail
+        # and drop the connection, instead of waiting for it here
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def _safe_filename(text: str) -> str:
+    return re.sub(r'[<>:"/\\|?*\x00-\x1f]+', "_", text).strip(" .")[:80] or "job"
+
+
+class DirectorySink:
+    """Destination that captures each job as a file in a directory.
+
+    Files are written under a temporary name and renamed into place when
+    complete, so readers never see a partial job.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        path: str,
+        naming: str = "{timestamp}_{source}_{job}.{ext}",
+        compress: bool = False,
+        buffer_size: int = 1024 * 1024,
+    ):
+        self.name = name
+        self.path = Path(path)
+        self.naming = naming
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def accepts(self, datatype: str) -> bool:
+        return True
+
+    def queue_depth(self) -> Optional[int]:
+        return None
+
+    def _filename(self, doc_name: str, datatype: str, source: str, job_id: int) -> str:
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        now = time.time()
+        filename = self.naming.format(
+            timestamp=time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+            + f"-{int(now * 1000) % 1000:03d}",
+            date=time.strftime("%Y%m%d", time.localtime(now)),
+            source=_safe_filename(source),
+            job=job_id,
+            document=_safe_filename(doc_name),
+            seq=seq,
+            ext="emf" if datatype.startswith("NT EMF") else "prn",
+        )
+        return filename + ".gz" if self.compress else filename
+
+    def send(
+        self,
+        doc_name: str,
+        chunks: Iterable[bytes],
+        datatype: str = "RAW",
+        source: str = "",
+        job_id: int = 0,
+    ) -> str:
+        import gzip
+
+        final_path = self.path / self._filename(doc_name, datatype, source, job_id)
+        final_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = final_path.with_name(final_path.name + ".part")
+        try:
+            with open(temp_path, "wb", buffering=self.buffer_size) as raw:
+                out = raw
+                if self.compress:
+                    out = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+                for chunk in chunks:
+                    out.write(chunk)
+                if out is not raw:
+                    out.close()
+            os.replace(temp_path, final_path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return final_path.name
+
+    def close(self):
+        pass
+
+
+class PipeSink:
+    """Destination that streams each job to a named pipe (or POSIX FIFO).
+
+    The pipe is opened per job, so the reader sees end-of-file after each
+    job. Fails immediately if nothing is reading the pipe.
+    """
+
+    def __init__(self, name: str, path: str, buffer_size: int = 1024 * 1024):
+        self.name = name
+        self.path = path
+        self.buffer_size = buffer_size
+        self.jobs_sent = 0
+        self._lock = threading.Lock()
+
+    def accepts(self, datatype: str) -> bool:
+        return True
+
+    def queue_depth(self) -> Optional[int]:
+        return None
+
+    def _open(self):
+        if hasattr(os, "O_NONBLOCK") and os.path.exists(self.path):
+            # POSIX FIFO: open non-blocking so a missing reader raises ENXIO
+            # instead of hanging, then switch back to blocking writes.
+            fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            os.set_blocking(fd, True)
+            return os.fdopen(fd, "wb", buffering=self.buffer_size)
+        return open(self.path, "wb", buffering=self.buffer_size)
+
+    def send(
+        self,
+        doc_name: str,
+        chunks: Iterable[bytes],
+        datatype: str = "RAW",
+        source: str = "",
+        job_id: int = 0,
+    ) -> str:
+        with self._lock:
+            with self._open() as out:
+                for chunk in chunks:
+                    out.write(chunk)
+            self.jobs_sent += 1
+            return f"{self.path}#{self.jobs_sent}"
+
+    def close(self):
+        pass
+
+
+def _send_frame(sock: socket.socket, kind: bytes, payload: bytes = b""):
+    """Write one relay frame: 4-byte length, 1-byte kind, payload."""
+    sock.sendall(len(payload).to_bytes(4, "big") + kind + payload)
+
+
+def _recv_exact(sock: socket.socket, count: int) -> bytes:
+    data = bytearray()
+    while len(data) < count:
+        part = sock.recv(min(count - len(data), 1024 * 1024))
+        if not part:
+            raise ConnectionError("relay connection closed")
+        data += part
+    return bytes(data)
+
+
+def _recv_frame(sock: socket.socket) -> Tuple[bytes, bytes]:
+    header = _recv_exact(sock, 5)
+    return header[4:5], _recv_exact(sock, int.from_bytes(header[:4], "big"))
+
+
+class RelaySink:
+    """Destination that forwards jobs to a relay receiver at another site.
+
+    send() only stores the job in a local outbox directory. A background
+    thread keeps one TCP connection to the receiver and sends the outbox in
+    batches of up to `batch_jobs` jobs / `batch_mb` MB (zlib-compressed).
+    Each batch waits for one acknowledgement, so a WAN round trip is paid
+    per batch, not per job. Jobs are numbered. On (re)connect the receiver
+    reports the last number it printed, and everything after it is sent
+    again, so nothing is lost across disconnects or restarts. With `tls` the
+    connection is encrypted and the receiver's certificate is checked
+    against `ca_file` (default: the system's trusted CAs).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        port: int = 9700,
+        site: str = "",
+        outbox: Optional[str] = None,
+        token: str = "",
+        batch_jobs: int = 16,
+        batch_mb: float = 4,
+        linger: float = 0.2,
+        compress: bool = True,
+        timeout: float = 30.0,
+        tls: bool = False,
+        ca_file: str = "",
+    ):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.site = site or socket.gethostname()
+        self.outbox = Path(outbox) if outbox else RELAY_DIR / _safe_filename(name)
+        self.outbox.mkdir(parents=True, exist_ok=True)
+        self.token = token
+        self.batch_jobs = max(1, batch_jobs)
+        self.batch_bytes = int(batch_mb * 1024 * 1024)
+        self.linger = linger
+        self.compress = compress
+        self.timeout = timeout
+        self.ssl_context = (
+            ssl.create_default_context(cafile=ca_file or None) if tls else None
+        )
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._sock: Optional[socket.socket] = None
+        seq_file = self.outbox / "seq"
+        self._seq = int(seq_file.read_text()) if seq_file.exists() else 0
+        self._thread = threading.Thread(
+            target=self._run, name=f"relay-{name}", daemon=True
+        )
+        self._thread.start()
+
+    def accepts(self, datatype: str) -> bool:
+        return True
+
+    def queue_depth(self) -> Optional[int]:
+        """Jobs waiting in the outbox for the receiver to confirm."""
+        return len(self._pending())
+
+    def _pending(self) -> List[Path]:
+        return sorted(self.outbox.glob("*.job"))
+
+    def send(
+        self,
+        doc_name: str,
+        chunks: Iterable[bytes],
+        datatype: str = "RAW",
+        source: str = "",
+        job_id: int = 0,
+    ) -> str:
+        """Store the job in the outbox. Returns its relay sequence number."""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            (self.outbox / "seq").write_text(str(seq))
+        header = json.dumps(
+            {
+                "seq": seq,
+                "doc": doc_name,
+                "datatype": datatype,
+                "source": source,
+                "job": job_id,
+            }
+        ).encode()
+        part_path = self.outbox / f"{seq:012d}.part"
+        with open(part_path, "wb") as f:
+            f.write(len(header).to_bytes(4, "big") + header)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(part_path, part_path.with_suffix(".job"))
+        self._wake.set()
+        return f"relay #{seq}"
+
+    def _batch(self, after: int) -> Tuple[int, bytes]:
+        """Pack outbox jobs numbered above `after`. Returns (last seq, payload)."""
+        payload = bytearray()
+        last = after
+        count = 0
+        for path in self._pending():
+            seq = int(path.stem)
+            if seq <= after:
+                continue
+            if count and len(payload) + path.stat().st_size > self.batch_bytes:
+                break
+            data = path.read_bytes()
+            payload += len(data).to_bytes(8, "big") + data
+            last = seq
+            count += 1
+            if count >= self.batch_jobs:
+                break
+        return last, bytes(payload)
+
+    def _acknowledge(self, seq: int):
+        for path in self._pending():
+            if int(path.stem) <= seq:
+                path.unlink()
+
+    def _session(self):
+        """One connection: handshake, then send batches until an error."""
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        if self.ssl_context is not None:
+            try:
+                sock = self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+            except BaseException:
+                sock.close()
+                raise
+        with sock:
+            self._sock = sock
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            hello = {"site": self.site, "token": self.token}
+            _send_frame(sock, b"H", json.dumps(hello).encode())
+            kind, payload = _recv_frame(sock)
+            if kind != b"A":
+                raise ConnectionError(payload.decode(errors="replace"))
+            acked = json.loads(payload)["seq"]
+            self._acknowledge(acked)
+            self.logger.info(f"Relay {self.name} connected to {self.host}:{self.port}")
+
+            while not self._stop.is_set():
+                pending = self._pending()
+                if len(pending) < self.batch_jobs:
+                    # Give a burst of jobs a moment to join the batch
+                    self._wake.wait(self.linger if pending else self.timeout)
+                    self._wake.clear()
+                last, payload = self._batch(acked)
+                if last == acked:
+                    # Idle: a tiny frame keeps NAT and firewalls from dropping us
+                    _send_frame(sock, b"P")
+                    _recv_frame(sock)
+                    continue
+                if self.compress:
+                    _send_frame(sock, b"Z", zlib.compress(payload, 6))
+                else:
+                    _send_frame(sock, b"B", payload)
+                kind, reply = _recv_frame(sock)
+                if kind != b"A":
+                    raise ConnectionError(reply.decode(errors="replace"))
+                acked = json.loads(reply)["seq"]
+                self._acknowledge(acked)
+                if acked < last:
+                    raise ConnectionError(f"receiver stopped at relay #{acked}")
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self._session()
+            except (OSError, ValueError, KeyError) as e:
+                if self._stop.is_set():
+                    return
+                self.logger.info(f"Relay {self.name}: {e}, retrying in {delay:.0f}s")
+            finally:
+                self._sock = None
+            if time.monotonic() - started > 60:
+                delay = 1.0
+            self._stop.wait(delay)
+            delay = min(delay * 2, 60.0)
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        sock = self._sock
+        if sock is not None:
+            # Ends a wait for an acknowledgement; unsent jobs stay in the outbox
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join(5.0)
+
+
+def make_sink(name: str, spec: Optional[dict] = None):
+    """Build the destination sink for `name` from its `destinations` entry."""
+    if not spec or spec.get("type", "printer") == "printer":
+        return PrinterSink(spec.get("printer", name) if spec else name)
+    kind = spec["type"]
+    if kind == "tcp":
+        return RawTcpSink(
+            name,
+            spec["host"],
+            port=int(spec.get("port", 9100)),
+            timeout=float(spec.get("timeout", 10.0)),
+            idle_timeout=float(spec.get("idle_timeout", 30.0)),
+            keepalive=bool(spec.get("keepalive", True)),
+        )
+    if kind == "directory":
+        return DirectorySink(
+            name,
+            spec["path"],
+            naming=spec.get("naming", "{timestamp}_{source}_{job}.{ext}"),
+            compress=bool(spec.get("compress", False)),
+        )
+    if kind == "pipe":
+        return PipeSink(name, spec["path"])
+    if kind == "relay":
+        return RelaySink(
+            name,
+            spec["host"],
+            port=int(spec.get("port", 9700)),
+            site=spec.get("site", ""),
+            outbox=spec.get("outbox"),
+            token=spec.get("token", ""),
+            batch_jobs=int(spec.get("batch_jobs", 16)),
+            batch_mb=float(spec.get("batch_mb", 4)),
+            linger=float(spec.get("linger", 0.2)),
+            compress=bool(spec.get("compress", True)),
+            timeout=float(spec.get("timeout", 30.0)),
+            tls=bool(spec.get("tls", False)),
+            ca_file=spec.get("ca_file", ""),
+        )
+    raise ValueError(f"Unknown destination type for {name}: {kind}")
+
+
+def scoped_destinations(specs: dict, scope: str) -> dict:
+    """The `destinations` of one pipeline or shard.
+
+    Relay destinations number their jobs per outbox and per site, so each
+    pipeline or shard gets its own outbox and reports itself as its own site.
+    """
+    scoped = {}
+    for name, spec in specs.items():
+        if spec.get("type") == "relay":
+            outbox = spec.get("outbox") or str(RELAY_DIR / _safe_filename(name))
+            site = spec.get("site") or socket.gethostname()
+            spec = {**spec, "outbox": f"{outbox}-{scope}", "site": f"{site}/{scope}"}
+        scoped[name] = spec
+    return scoped
+
+
+ESC, GS, FS, DLE = 0x1B, 0x1D, 0x1C, 0x10
+_ESCPOS_COMMAND = re.compile(rb"[\x10\x1b\x1c\x1d]")
+
+# Parameter byte counts of fixed-length ESC/POS commands, so their
+# parameters are never mistaken for the start of another command
+_ESC_PARAMS = {
+    b"@": 0, b"!": 1, b"-": 1, b"E": 1, b"G": 1, b"M": 1, b"R": 1, b"t": 1,
+    b"a": 1, b"d": 1, b"e": 1, b"J": 1, b"K": 1, b"2": 0, b"3": 1, b"{": 1,
+    b"V": 1, b"r": 1, b" ": 1, b"$": 2, b"\\": 2, b"U": 1, b"L": 0, b"S": 0,
+    b"T": 1, b"W": 8, b"=": 1, b"%": 1, b"<": 0, b"c": 2, b"i": 0, b"m": 0,
+    b"p": 3, b"B": 2,
+}
+_GS_PARAMS = {
+    b"!": 1, b"B": 1, b"H": 1, b"f": 1, b"h": 1, b"w": 1, b"L": 2, b"W": 2,
+    b"$": 2, b"\\": 2, b"P": 2, b"a": 1, b"r": 1, b"I": 1, b"/": 1, b"b": 1,
+    b":": 0, b"^": 3, b"E": 1, b"T": 1,
+}
+_FS_PARAMS = {b"p": 2, b"&": 0, b".": 0, b"!": 1, b"-": 1, b"S": 2, b"W": 1, b"C": 1}
+# Longest NUL-terminated command (tab stops, old barcodes) held across chunks
+_ESCPOS_MAX_PENDING = 256
+
+
+class EscPosTransform:
+    """Streaming rewriter for ESC/POS receipt jobs.
+
+    Tokenizes the job chunk by chunk and drops the cash drawer kick (ESC p,
+    DLE DC4 1), cuts (GS V, ESC i/m) and/or images and logos (GS v 0,
+    ESC *, GS ( L, GS 8 L, GS *, GS /, FS p), and prints `copy_marker`
+    at the top of the receipt. Plain text is copied through unchanged.
+    Image data is skipped by count without being read into memory, so only
+    the few header bytes of a command split across chunks are held.
+    """
+
+    def __init__(
+        self,
+        copy_marker: str = "",
+        strip_drawer: bool = True,
+        strip_cut: bool = False,
+        strip_images: bool = False,
+        formats: Optional[List[str]] = None,
+        encoding: str = "cp437",
+    ):
+        self.formats = set(formats or ["escpos"])
+        self.strip_drawer = strip_drawer
+        self.strip_cut = strip_cut
+        self.strip_images = strip_images
+        self.marker = b""
+        if copy_marker:
+            # Centered, bold, then back to the defaults
+            self.marker = (
+                b"\x1ba\x01\x1bE\x01"
+                + copy_marker.encode(encoding, errors="replace")
+                + b"\n\x1bE\x00\x1ba\x00"
+            )
+
+    def _command(self, data, i: int) -> Tuple[Optional[int], bool]:
+        """Length of the command at data[i] and whether to drop it.
+
+        Returns (None, False) when the command is not complete yet.
+        """
+        n = len(data) - i
+        if n < 2:
+            return None, False
+        prefix, code = data[i], data[i + 1 : i + 2]
+
+        def need(count: int) -> bool:
+            return n >= count
+
+        if prefix == ESC:
+            if code == b"p":
+                return 5, self.strip_drawer
+            if code in (b"i", b"m"):
+                return 2, self.strip_cut
+            if code == b"*":
+                if not need(5):
+                    return None, False
+                m, width = data[i + 2], data[i + 3] | data[i + 4] << 8
+                return 5 + width * (1 if m in (0, 1) else 3), self.strip_images
+            if code == b"D":
+                end = data.find(b"\x00", i + 2, i + _ESCPOS_MAX_PENDING)
+                return (end - i + 1 if end >= 0 else None), False
+            if code == b"(":
+                if not need(5):
+                    return None, False
+                return 5 + (data[i + 3] | data[i + 4] << 8), False
+            return 2 + _ESC_PARAMS.get(code, 0), False
+
+        if prefix == GS:
+            if code == b"V":
+                if not need(3):
+                    return None, False
+                return (3 if data[i + 2] in (0, 1, 48, 49) else 4), self.strip_cut
+            if code == b"v":
+                if not need(8):
+                    return None, False
+                width = data[i + 4] | data[i + 5] << 8
+                height = data[i + 6] | data[i + 7] << 8
+                return 8 + width * height, self.strip_images
+            if code == b"(":
+                if not need(5):
+                    return None, False
+                size = 5 + (data[i + 3] | data[i + 4] << 8)
+                return size, self.strip_images and data[i + 2] == ord("L")
+            if code == b"8":
+                if not need(7):
+                    return None, False
+                size = int.from_bytes(bytes(data[i + 3 : i + 7]), "little")
+                return 7 + size, self.strip_images and data[i + 2] == ord("L")
+            if code == b"*":
+                if not need(4):
+                    return None, False
+                return 4 + data[i + 2] * data[i + 3] * 8, self.strip_images
+            if code == b"/":
+                return 3, self.strip_images
+            if code == b"k":
+                if not need(3):
+                    return None, False
+                if data[i + 2] <= 6:
+                    end = data.find(b"\x00", i + 3, i + _ESCPOS_MAX_PENDING)
+                    return (end - i + 1 if end >= 0 else None), False
+                return (4 + data[i + 3] if need(4) else None), False
+            return 2 + _GS_PARAMS.get(code, 0), False
+
+        if prefix == FS:
+            if code == b"p":
+                return 4, self.strip_images
+            if code == b"(":
+                if not need(5):
+                    return None, False
+                return 5 + (data[i + 3] | data[i + 4] << 8), False
+            return 2 + _FS_PARAMS.get(code, 0), False
+
+        # DLE real-time commands
+        if code == b"\x14":
+            if not need(3):
+                return None, False
+            fn = data[i + 2]
+            if fn == 1:
+                return 5, self.strip_drawer
+            return (5 if fn == 2 else 10 if fn == 8 else 3), False
+        if code in (b"\x04", b"\x05"):
+            return 3, False
+        return 1, False
+
+    def __call__(self, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        pending = b""
+        skip = copy = 0
+        marker = self.marker
+        for chunk in chunks:
+            data = pending + chunk if pending else chunk
+            pending = b""
+            out = bytearray()
+            end = len(data)
+            i = 0
+            if skip or copy:
+                # Rest of a long command from the previous chunk
+                take = min(skip or copy, end)
+                if copy:
+                    out += data[:take]
+                    copy -= take
+                else:
+                    skip -= take
+                i = take
+
+            while i < end:
+                match = _ESCPOS_COMMAND.search(data, i)
+                start = match.start() if match else end
+                if start > i:
+                    if marker:
+                        out += marker
+                        marker = b""
+                    out += data[i:start]
+                    i = start
+                    continue
+
+                length, drop = self._command(data, i)
+                if length is None:
+                    if end - i >= _ESCPOS_MAX_PENDING:
+                        # Not a command we can parse; pass the byte on
+                        out.append(data[i])
+                        i += 1
+                        continue
+                    pending = bytes(data[i:])
+                    break
+
+                if marker and data[i : i + 2] != b"\x1b@":
+                    out += marker
+                    marker = b""
+                stop = min(i + length, end)
+                if not drop:
+                    out += data[i:stop]
+                    copy = i + length - stop
+                else:
+                    skip = i + length - stop
+                i = stop
+
+            if out:
+                yield bytes(out)
+        if pending:
+            yield pending
+        elif marker:
+            yield marker
+
+
+TRANSFORMS = {"escpos": EscPosTransform}
+
+
+def make_transform(spec: dict):
+    """Build a transform stage from its `transforms` config entry."""
+    spec = dict(spec)
+    kind = spec.pop("type", "escpos")
+    if kind not in TRANSFORMS:
+        raise ValueError(f"Unknown transform type: {kind}")
+    return TRANSFORMS[kind](**spec)
+
+
+def benchmark_transform(size_mb: float = 16.0) -> List[Tuple[str, float]]:
+    """Time the ESC/POS transform on a synthetic receipt stream.
+
+    Returns (stage, ms per MB) for a plain pass over the chunks and for
+    each transform setting, so the overhead per MB is the difference.
+    """
+    receipt = (
+        b"\x1b@\x1ba\x01\x1d!\x11EMILIA CAFE\n\x1d!\x00\x1ba\x00"
+        + b"1x Espresso                  2.50\n" * 20
+        + b"\x1d(L\x06\x000E  \x01\x01"  # print stored logo
+        + b"\x1dv0\x00\x30\x00\x40\x00" + bytes(48 * 64)  # raster image
+        + b"\x1bp\x00\x19\xfa"  # drawer kick
+        + b"\x1dVA\x10"  # feed and cut
+    )
+    chunk = receipt * (1024 * 1024 // len(receipt) + 1)
+    chunk_count = max(1, int(size_mb))
+    chunks = [chunk[: 1024 * 1024]] * chunk_count
+
+    stages = [
+        ("passthrough", lambda c: iter(c)),
+        ("marker+drawer", EscPosTransform(copy_marker="*** COPY ***")),
+        (
+            "all stripped",
+            EscPosTransform(
+                copy_marker="*** COPY ***", strip_cut=True, strip_images=True
+            ),
+        ),
+    ]
+    results = []
+    for name, stage in stages:
+        started = time.perf_counter()
+        for _ in stage(chunks):
+            pass
+        elapsed = time.perf_counter() - started
+        results.append((name, elapsed * 1000 / chunk_count))
+    return results
+
+
+def _submitted_ms(submitted) -> int:
+    """Convert EnumJobs' Submitted time (pywintypes datetime) to ms."""
+    try:
+        return int(submitted.timestamp() * 1000)
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+class JobTracker:
+    """Remembers which jobs of one source queue were already handled.
+
+    A job is identified by its id plus its submission time, so when the
+    spooler reuses an id after purging a job the new job is not mistaken
+    for the old one. The size is not part of the identity because it grows
+    while the job is still spooling.
+    """
+
+    __slots__ = ("stamps",)
+
+    def __init__(self):
+        # job id -> submission time (ms); one small int pair per job
+        self.stamps: Dict[int, int] = {}
+
+    def reset(self, jobs: dict):
+        """Treat every job in `jobs` (job id -> info) as already handled."""
+        self.stamps = {job_id: info["submitted"] for job_id, info in jobs.items()}
+
+    def mark(self, job_id: int, info: dict):
+        self.stamps[job_id] = info["submitted"]
+
+    def unmark(self, job_id: int):
+        """Forget a job so the next diff reports it again."""
+        self.stamps.pop(job_id, None)
+
+    def diff(self, jobs: dict) -> List[int]:
+        """Return the ids in `jobs` not handled yet and forget vanished jobs.
+
+        The purge pass only runs when a handled job has left the queue or
+        been replaced, so an unchanged queue costs one lookup per job.
+        """
+        stamps = self.stamps
+        new_ids = []
+        matched = 0
+        for job_id, info in jobs.items():
+            if stamps.get(job_id) == info["submitted"]:
+                matched += 1
+            else:
+                new_ids.append(job_id)
+        if matched != len(stamps):
+            replaced = set(new_ids)
+            for job_id in [j for j in stamps if j not in jobs or j in replaced]:
+                del stamps[job_id]
+        return new_ids
+
+    def __len__(self) -> int:
+        return len(self.stamps)
+
+
+class PollSchedule:
+    """Adaptive polling interval for one source printer.
+
+    Polls every `min_interval` while jobs keep arriving and backs off by
+    `backoff` per idle poll, up to `max_interval`.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, backoff: float = 2.0):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.current = min_interval
+        self.next_poll = 0.0
+        self.last_activity = 0.0
+
+    def due(self, now: float) -> bool:
+        return now >= self.next_poll
+
+    def update(self, active: bool, now: float) -> float:
+        """Record a poll result and return the delay until the next poll."""
+        if active:
+            self.current = self.min_interval
+            self.last_activity = time.time()
+        else:
+            self.current = min(self.current * self.backoff, self.max_interval)
+        self.next_poll = now + self.current
+        return self.current
+
+    def hold(self, now: float) -> float:
+        """Poll again after `min_interval`, without counting it as activity."""
+        self.current = self.min_interval
+        self.next_poll = now + self.current
+        return self.current
+
+
+class JobFilter:
+    """Chain of rules that drop source jobs before their spool file is read.
+
+    Built once from the `filters` config section. Each rule is a predicate
+    on the EnumJobs info of a job; the first rule that matches names the
+    reason the job is dropped.
+    """
+
+    def __init__(self, spec: dict):
+        self.rules: List[Tuple[str, Callable[[dict], bool]]] = []
+
+        owners = {o.lower() for o in spec.get("owners", [])}
+        if owners:
+            self.rules.append(("owner", lambda j: j["owner"].lower() in owners))
+
+        machines = {m.lstrip("\\").lower() for m in spec.get("machines", [])}
+        if machines:
+            self.rules.append(
+                ("machine", lambda j: j["machine"].lstrip("\\").lower() in machines)
+            )
+
+        if spec.get("document_regex"):
+            try:
+                pattern = re.compile(spec["document_regex"], re.IGNORECASE)
+            except re.error as e:
+                raise ValueError(f"Invalid filters.document_regex: {e}") from None
+            self.rules.append(("document", lambda j: bool(pattern.search(j["document"]))))
+
+        datatypes = {d.lower() for d in spec.get("datatypes", [])}
+        if datatypes:
+            self.rules.append(
+                ("datatype", lambda j: j["datatype"].lower() in datatypes)
+            )
+
+        # Page and size rules only make sense once the job is fully spooled
+        min_pages = spec.get("min_pages", 0)
+        max_pages = spec.get("max_pages", 0)
+        if min_pages or max_pages:
+            self.rules.append(
+                (
+                    "pages",
+                    lambda j: j["pages"] > 0
+                    and (j["pages"] < min_pages or 0 < max_pages < j["pages"]),
+                )
+            )
+        min_size = int(spec.get("min_size_kb", 0) * 1024)
+        max_size = int(spec.get("max_size_mb", 0) * 1024 * 1024)
+        if min_size or max_size:
+            self.rules.append(
+                ("size", lambda j: j["size"] < min_size or 0 < max_size < j["size"])
+            )
+        self.needs_complete = bool(min_pages or max_pages or min_size or max_size)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def match(self, job: dict) -> Optional[str]:
+        """Return the name of the first rule that drops `job`, or None."""
+        for name, rule in self.rules:
+            if rule(job):
+                return name
+        return None
+
+
+class CircuitBreaker:
+    """Health tracking for one destination (closed -> open -> half-open)."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold: int = 3, reset_timeout: float = 30.0):
+        self.threshold = max(1, int(threshold))
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a job may be sent to this destination now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.probing = False
+            if self.state == self.HALF_OPEN:
+                # Only one probe job at a time while half-open
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_neutral(self):
+        """End a send that says nothing about the destination's health."""
+        with self._lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class MemoryBudget:
+    """Bounds the spool bytes held in memory by all in-progress copies."""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int, timeout: Optional[float] = None) -> bool:
+        """Block until `size` bytes fit in the budget. Returns False on timeout."""
+        size = min(size, self.limit)
+        with self._cond:
+            if self.in_use + size > self.limit:
+                self.waits += 1
+                if not self._cond.wait_for(
+                    lambda: self.in_use + size <= self.limit, timeout
+                ):
+                    return False
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+            return True
+
+    def try_acquire(self, size: int) -> bool:
+        """Take `size` bytes only if they fit right now."""
+        with self._cond:
+            if self.in_use + size > self.limit:
+                return False
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+            return True
+
+    def release(self, size: int):
+        size = min(size, self.limit)
+        with self._cond:
+            self.in_use = max(0, self.in_use - size)
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, size: int):
+        self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+
+class _ProfileStats:
+    """Stats dict in the shape pstats.Stats() loads from a profiler."""
+
+    def __init__(self, stats: dict):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _stats_since(stats: dict, previous: dict) -> dict:
+    """Subtract an earlier snapshot of the same profile from `stats`."""
+    result = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        if func not in previous:
+            result[func] = (cc, nc, tt, ct, callers)
+            continue
+        pcc, pnc, ptt, pct, pcallers = previous[func]
+        if nc == pnc:
+            continue
+        since = {}
+        for caller, counts in callers.items():
+            before = pcallers.get(caller)
+            if before is None:
+                since[caller] = counts
+            elif counts != before:
+                since[caller] = tuple(a - b for a, b in zip(counts, before))
+        result[func] = (cc - pcc, nc - pnc, tt - ptt, ct - pct, since)
+    return result
+
+
+class MirrorProfiler:
+    """Writes periodic CPU (pstats) and allocation (tracemalloc) dumps.
+
+    Only created when profiling is enabled. start() must run on the thread
+    that drives the mirror (loop, event loop or dispatcher) before it starts
+    its worker threads. From Python 3.12 cProfile sees every thread; on
+    older versions each thread started afterwards gets its own profile,
+    and they are merged into each dump.
+    """
+
+    def __init__(
+        self, out_dir: Path = PROFILE_DIR, interval: float = 300.0, top: int = 30
+    ):
+        self.out_dir = Path(out_dir)
+        self.interval = interval
+        self.top = top
+        self.profile = None
+        self.last_dump = 0.0
+        self.last_snapshot = None
+        # Numbers the dumps, so two in the same second get their own files
+        self.dumps = 0
+        # Per-thread profiles (Python < 3.12) and their stats at the last dump
+        self._thread_profiles: list = []
+        self._thread_dumped: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+
+        if self.profile is not None:
+            return
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+        self.last_dump = time.monotonic()
+
+    def _profile_thread(self, frame, event, arg):
+        """Runs once in each new thread, replacing itself with a profile."""
+        import cProfile
+
+        profile = cProfile.Profile()
+        with self._lock:
+            self._thread_profiles.append(profile)
+        profile.enable()
+
+    def _thread_stats(self) -> List[_ProfileStats]:
+        """What each worker thread ran since the last dump."""
+        views = []
+        with self._lock:
+            profiles = list(self._thread_profiles)
+        for profile in profiles:
+            # Reads the counters without stopping the other thread's profile
+            profile.snapshot_stats()
+            previous = self._thread_dumped.get(id(profile), {})
+            self._thread_dumped[id(profile)] = profile.stats
+            stats = _stats_since(profile.stats, previous)
+            if stats:
+                views.append(_ProfileStats(stats))
+        return views
+
+    def tick(self):
+        """Call once per scan; dumps when the interval has elapsed."""
+        if self.profile is None:
+            self.start()
+        elif time.monotonic() - self.last_dump >= self.interval:
+            self.dump()
+
+    def dump(self) -> Optional[Path]:
+        """Write the stats gathered since the last dump and start over."""
+        import cProfile
+        import tracemalloc
+
+        if self.profile is None:
+            return None
+        import pstats
+
+        self.dumps += 1
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.dumps:04d}"
+        self.profile.disable()
+        stats = pstats.Stats(self.profile)
+        for view in self._thread_stats():
+            stats.add(view)
+        stats.dump_stats(str(self.out_dir / f"cpu-{stamp}.pstats"))
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        alloc_path = self.out_dir / f"alloc-{stamp}.txt"
+        with open(alloc_path, "w") as f:
+            f.write(f"Traced memory: current={current} bytes, peak={peak} bytes\n\n")
+            f.write(f"Top {self.top} allocators:\n")
+            for stat in snapshot.statistics("lineno")[: self.top]:
+                f.write(f"  {stat}\n")
+            if self.last_snapshot is not None:
+                f.write(f"\nTop {self.top} changes since last dump:\n")
+                for stat in snapshot.compare_to(self.last_snapshot, "lineno")[
+                    : self.top
+                ]:
+                    f.write(f"  {stat}\n")
+        self.last_snapshot = snapshot
+
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self.last_dump = time.monotonic()
+        return alloc_path
+
+    def stop(self):
+        if self.profile is not None:
+            threading.setprofile(None)
+            self.dump()
+            self.profile.disable()
+            self.profile = None
+            with self._lock:
+                profiles, self._thread_profiles = self._thread_profiles, []
+            # cProfile can only unhook itself from its own thread, so a worker
+            # still running keeps a (no longer read) profile until it exits
+            for profile in profiles:
+                profile.disable()
+            self._thread_dumped.clear()
+
+
+# JOB_INFO_2 Status bits
+JOB_STATUS_DELETING = 0x4
+JOB_STATUS_SPOOLING = 0x8
+JOB_STATUS_PRINTED = 0x80
+JOB_STATUS_COMPLETE = 0x1000
+
+
+class SpoolFollowError(Exception):
+    """A job being followed while spooling stalled or was cancelled."""
+
+
+class DestinationsHeld(Exception):
+    """Every destination for a job is paused by its breaker; try it later."""
+
+
+class PrinterMirrorCore:
+    """Core mirror service with multi-source support."""
+
+    def __init__(
+        self,
+        source_printers: List[str],
+        dest_printer: str,
+        interval: float = 1.0,
+        logger=None,
+        fallback_printers: Optional[List[str]] = None,
+        breaker_threshold: int = 3,
+        breaker_reset: float = 30.0,
+        shortest_job_first: bool = False,
+        max_scan_seconds: float = 10.0,
+        memory_budget: Optional[MemoryBudget] = None,
+        stream_threshold: int = 8 * 1024 * 1024,
+        chunk_size: int = 1024 * 1024,
+        skip_formats: Optional[List[str]] = None,
+        destination_specs: Optional[Dict[str, dict]] = None,
+        capture_to: Optional[List[str]] = None,
+        max_interval: float = 0,
+        poll_backoff: float = 2.0,
+        source_overrides: Optional[Dict[str, dict]] = None,
+        tail_follow: bool = False,
+        tail_poll: float = 0.2,
+        tail_stall_timeout: float = 30.0,
+        enum_workers: int = 8,
+        enum_timeout: float = 5.0,
+    ):
+        self.source_printers = source_printers
+        self.dest_printer = dest_printer
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.running = False
+        self.processed_jobs: Dict[str, JobTracker] = {
+            p: JobTracker() for p in source_printers
+        }
+        # Primary destination first, then fallbacks in configured order
+        self.destinations = [dest_printer] + [
+            p for p in (fallback_printers or []) if p != dest_printer
+        ]
+        self.breakers: Dict[str, CircuitBreaker] = {
+            d: CircuitBreaker(breaker_threshold, breaker_reset)
+            for d in self.destinations
+        }
+        self.capture_to = [d for d in (capture_to or []) if d not in self.destinations]
+        self.sinks = {
+            d: make_sink(d, (destination_specs or {}).get(d))
+            for d in self.destinations + self.capture_to
+        }
+        self.metrics: Counter = Counter()
+        self.shortest_job_first = shortest_job_first
+        self.max_scan_seconds = max_scan_seconds
+        # Rotates the source served first so a capped scan stays fair
+        self._rr_offset = 0
+        self.memory_budget = memory_budget or MemoryBudget(64 * 1024 * 1024)
+        self.stream_threshold = min(stream_threshold, self.memory_budget.limit)
+        self.chunk_size = chunk_size
+        self.skip_formats = set(["xps"] if skip_formats is None else skip_formats)
+        # Time given to the spooler to finish writing a job before reading it
+        self.settle_delay = 1.0
+        # Waits while locating a spool file: before reading it, between retries
+        self.spool_read_delay = 0.3
+        self.spool_retry_delay = 0.5
+        self.tail_follow = tail_follow
+        self.tail_poll = tail_poll
+        self.tail_stall_timeout = tail_stall_timeout
+        self.enum_workers = enum_workers
+        self.enum_timeout = enum_timeout
+        self._enum_pool: Optional[ThreadPoolExecutor] = None
+        # Sources whose EnumJobs call has not returned yet
+        self._enum_busy: Set[str] = set()
+        self.profiler: Optional[MirrorProfiler] = None
+        self.job_filter: Optional[JobFilter] = None
+        self.ingest: Optional["IngestServer"] = None
+        self.relay: Optional["RelayReceiver"] = None
+        self.ha: Optional["HighAvailability"] = None
+        self.retention: Optional["RetentionManager"] = None
+        self.watchdog: Optional["SloWatchdog"] = None
+        self.backpressure: Optional["Backpressure"] = None
+        self.recorder: Optional["TraceRecorder"] = None
+        self.transforms: list = []
+        # Latest EnumJobs result per source, shared with the retention thread
+        self.last_jobs: Dict[str, dict] = {}
+        self.schedules: Dict[str, PollSchedule] = {}
+        for printer in source_printers:
+            override = (source_overrides or {}).get(printer, {})
+            min_interval = override.get("interval", interval)
+            self.schedules[printer] = PollSchedule(
+                min_interval,
+                override.get("max_interval", max_interval or min_interval),
+                override.get("backoff", poll_backoff),
+            )
+        # Written every few seconds for `status` and the GUI (None = off)
+        self.status_path: Optional[Path] = None
+        self._status_written = 0.0
+        self.spool_dir = os.path.join(
+            os.environ.get("SystemRoot", "C:\\Windows"), "System32", "spool", "PRINTERS"
+        )
+
+    @classmethod
+    def from_config(
+        cls,
+        config: dict,
+        logger=None,
+        memory_budget: Optional[MemoryBudget] = None,
+    ) -> "PrinterMirrorCore":
+        """Build a mirror core from a config dict (see DEFAULT_CONFIG).
+
+        Pass `memory_budget` to share one budget between several cores.
+        """
+        core = cls(
+            source_printers=config["source_printers"],
+            dest_printer=config["dest_printer"],
+            interval=config["interval"],
+            logger=logger,
+            fallback_printers=config["fallback_printers"],
+            breaker_threshold=config["breaker_threshold"],
+            breaker_reset=config["breaker_reset"],
+            shortest_job_first=config["shortest_job_first"],
+            max_scan_seconds=config["max_scan_seconds"],
+            memory_budget=memory_budget
+            or MemoryBudget(config["memory_budget_mb"] * 1024 * 1024),
+            stream_threshold=int(config["stream_threshold_mb"] * 1024 * 1024),
+            skip_formats=config["skip_formats"],
+            destination_specs=config["destinations"],
+            capture_to=config["capture_to"],
+            max_interval=config["max_interval"],
+            poll_backoff=config["poll_backoff"],
+            source_overrides=config["source_overrides"],
+            tail_follow=config["tail_follow"],
+            tail_poll=config["tail_poll"],
+            tail_stall_timeout=config["tail_stall_timeout"],
+            enum_workers=config["enum_workers"],
+            enum_timeout=config["enum_timeout"],
+        )
+        core.job_filter = JobFilter(config["filters"]) or None
+        core.transforms = [make_transform(spec) for spec in config["transforms"]]
+        ingest = {**DEFAULT_CONFIG["ingest"], **config.get("ingest", {})}
+        if ingest.pop("enabled"):
+            core.ingest = IngestServer(core, **ingest)
+        relay = {**DEFAULT_CONFIG["relay_receiver"], **config.get("relay_receiver", {})}
+        if relay.pop("enabled"):
+            core.relay = RelayReceiver(core, **relay)
+        retention = {**DEFAULT_CONFIG["retention"], **config.get("retention", {})}
+        if retention.pop("enabled"):
+            core.retention = RetentionManager(core, **retention)
+        backpressure = {
+            **DEFAULT_CONFIG["backpressure"],
+            **config.get("backpressure", {}),
+        }
+        if backpressure.pop("enabled"):
+            core.backpressure = Backpressure(core, **backpressure)
+        slo = {**DEFAULT_CONFIG["slo"], **config.get("slo", {})}
+        if slo.pop("enabled"):
+            core.watchdog = SloWatchdog(core, **slo)
+        ha = {**DEFAULT_CONFIG["ha"], **config.get("ha", {})}
+        if ha.pop("enabled"):
+            core.ha = HighAvailability(core, **ha)
+        return core
+
+    def log(self, message: str):
+        self.logger.info(message)
+
+    def _find_spool_file(self, job_id: int) -> Optional[str]:
+        """Find the SPL file for a specific job."""
+        try:
+            patterns = [f"FP{job_id:05d}.SPL", f"{job_id:05d}.SPL"]
+            for pattern in patterns:
+                filepath = os.path.join(self.spool_dir, pattern)
+                if os.path.exists(filepath):
+                    return filepath
+
+            spl_files = []
+            for f in os.listdir(self.spool_dir):
+                if f.upper().endswith(".SPL"):
+                    full_path = os.path.join(self.spool_dir, f)
+                    try:
+                        mtime = os.path.getmtime(full_path)
+                        size = os.path.getsize(full_path)
+                        if size > 0:
+                            spl_files.append((full_path, mtime))
+                    except OSError:
+                        continue
+
+            if spl_files:
+                spl_files.sort(key=lambda x: x[1], reverse=True)
+                return spl_files[0][0]
+        except Exception as e:
+            self.log(f"Error finding spool file: {e}")
+        return None
+
+    def _locate_spool_file(
+        self, job_id: int, retries: int = 5
+    ) -> Optional[Tuple[str, int]]:
+        """Find a non-empty spool file with retries. Returns (path, size)."""
+        for attempt in range(retries):
+            spool_file = self._find_spool_file(job_id)
+            if spool_file:
+                try:
+                    time.sleep(self.spool_read_delay)
+                    size = os.path.getsize(spool_file)
+                    if size > 0:
+                        return spool_file, size
+                except OSError:
+                    pass
+            if attempt < retries - 1:
+                time.sleep(self.spool_retry_delay)
+        return None
+
+    def _iter_spool_chunks(self, spool_file: str) -> Iterator[bytes]:
+        """Stream a spool file; each chunk is charged to the memory budget."""
+        with open(spool_file, "rb") as f:
+            while True:
+                self.memory_budget.acquire(self.chunk_size)
+                try:
+                    chunk = f.read(self.chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+                finally:
+                    self.memory_budget.release(self.chunk_size)
+
+    def _job_status(self, printer: str, job_id: int) -> Optional[int]:
+        """Current status bits of a source job, or None once it is gone."""
+        try:
+            handle = win32print.OpenPrinter(printer)
+            try:
+                return win32print.GetJob(handle, job_id, 1).get("Status", 0)
+            finally:
+                win32print.ClosePrinter(handle)
+        except Exception:
+            return None
+
+    def _wait_for_header(self, printer: str, job_id: int, spool_file: str) -> bytes:
+        """Wait until a spooling job has enough data to sniff its format."""
+        last_size = -1
+        last_growth = time.monotonic()
+        while True:
+            size = os.path.getsize(spool_file)
+            status = self._job_status(printer, job_id)
+            if size >= SNIFF_BYTES or not (status or 0) & JOB_STATUS_SPOOLING:
+                with open(spool_file, "rb") as f:
+                    return f.read(SNIFF_BYTES)
+            if size != last_size:
+                last_size, last_growth = size, time.monotonic()
+            elif time.monotonic() - last_growth > self.tail_stall_timeout:
+                raise SpoolFollowError(f"job {job_id} stalled while spooling")
+            time.sleep(self.tail_poll)
+
+    def _follow_spool_chunks(
+        self, printer: str, job_id: int, spool_file: str
+    ) -> Iterator[bytes]:
+        """Stream a spool file that is still being written.
+
+        At end of file the source job is checked: while the spooler reports
+        it as spooling we wait for more data, otherwise one last read drains
+        the file and the copy finishes.
+        """
+        started = last_growth = time.monotonic()
+        sent = 0
+        finishing = False
+        with open(spool_file, "rb") as f:
+            while True:
+                self.memory_budget.acquire(self.chunk_size)
+                try:
+                    chunk = f.read(self.chunk_size)
+                    if chunk:
+                        sent += len(chunk)
+                        last_growth = time.monotonic()
+                        yield chunk
+                        continue
+                finally:
+                    self.memory_budget.release(self.chunk_size)
+                if finishing:
+                    break
+
+                status = self._job_status(printer, job_id)
+                if status is not None and status & JOB_STATUS_DELETING:
+                    raise SpoolFollowError(f"job {job_id} was cancelled while spooling")
+                if status is None or not status & JOB_STATUS_SPOOLING:
+                    finishing = True
+                    continue
+                if time.monotonic() - last_growth > self.tail_stall_timeout:
+                    raise SpoolFollowError(
+                        f"job {job_id} stalled while spooling ({sent} bytes read)"
+                    )
+                time.sleep(self.tail_poll)
+
+        self.metrics["bytes_followed"] += sent
+        self.log(
+            f"Spool complete: [{printer}] Job {job_id}, {sent} bytes followed "
+            f"over {time.monotonic() - started:.1f}s"
+        )
+
+    def _record_dest_result(self, dest: str, ok: bool):
+        """Update the destination's circuit breaker and log state changes."""
+        breaker = self.breakers[dest]
+        previous = breaker.state
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+            self.metrics["dest_failures"] += 1
+        if breaker.state != previous:
+            if breaker.state == CircuitBreaker.OPEN:
+                self.metrics["breaker_opened"] += 1
+                self.log(
+                    f"Destination {dest} marked DOWN after {breaker.failures} failure(s), "
+                    f"retry in {breaker.reset_timeout:.0f}s"
+                )
+            elif breaker.state == CircuitBreaker.CLOSED:
+                self.log(f"Destination {dest} recovered")
+
+    def _datatype_for(
+        self, source_printer: str, job_id: int, header: bytes
+    ) -> Optional[str]:
+        """Pick the resubmission datatype, or None if the job must be skipped."""
+        spool_format = sniff_spool_format(header)
+        datatype = SPOOL_DATATYPES.get(spool_format)
+        if datatype is None or spool_format in self.skip_formats:
+            self.log(
+                f"SKIP: [{source_printer}] Job {job_id} is {spool_format.upper()} "
+                f"and cannot be mirrored"
+            )
+            self.metrics[f"skipped_{spool_format}"] += 1
+            return None
+        self.metrics[f"format_{spool_format}"] += 1
+        return datatype
+
+    def _transformed(
+        self, header: bytes, chunks: Callable[[], Iterable[bytes]]
+    ) -> Callable[[], Iterable[bytes]]:
+        """Wrap a chunk factory in the transforms that apply to its format."""
+        spool_format = sniff_spool_format(header)
+        stages = [t for t in self.transforms if spool_format in t.formats]
+        if not stages:
+            return chunks
+
+        def transformed() -> Iterable[bytes]:
+            stream = chunks()
+            for stage in stages:
+                stream = stage(stream)
+            return stream
+
+        return transformed
+
+    def submit_data(
+        self, source: str, job_id: int, document_name: str, data: bytes
+    ) -> bool:
+        """Mirror a job received outside the spooler (e.g. network ingest)."""
+        try:
+            datatype = self._datatype_for(source, job_id, data[:SNIFF_BYTES])
+            if datatype is None:
+                return False
+            return self._deliver(
+                source,
+                job_id,
+                f"[MIRROR:{source}] {document_name}",
+                self._transformed(data[:SNIFF_BYTES], lambda: [data]),
+                len(data),
+                datatype,
+            )
+        except Exception as e:
+            self.log(f"Error copying job {job_id}: {e}")
+        self.metrics["jobs_failed"] += 1
+        return False
+
+    def _copy_job(
+        self,
+        source_printer: str,
+        job_id: int,
+        document_name: str,
+        spooling: bool = False,
+    ) -> bool:
+        """Copy a job to the first healthy destination.
+
+        With `tail_follow` on, a job that is still `spooling` is copied while
+        the spooler writes it instead of after it finished.
+        """
+        try:
+            located = self._locate_spool_file(job_id)
+            if not located:
+                self.log(f"Could not read job {job_id}")
+                self.metrics["jobs_failed"] += 1
+                return False
+            spool_file, size = located
+            if self.recorder is not None:
+                self.recorder.spool(job_id, spool_file, size)
+            doc_name = f"[MIRROR:{source_printer}] {document_name}"
+
+            if spooling and self.tail_follow:
+                header = self._wait_for_header(source_printer, job_id, spool_file)
+                datatype = self._datatype_for(source_printer, job_id, header)
+                if datatype is None:
+                    return False
+                self.metrics["jobs_followed"] += 1
+                return self._deliver(
+                    source_printer,
+                    job_id,
+                    doc_name,
+                    self._transformed(
+                        header,
+                        lambda: self._follow_spool_chunks(
+                            source_printer, job_id, spool_file
+                        ),
+                    ),
+                    None,
+                    datatype,
+                )
+
+            with open(spool_file, "rb") as f:
+                header = f.read(SNIFF_BYTES)
+            datatype = self._datatype_for(source_printer, job_id, header)
+            if datatype is None:
+                return False
+
+            if size > self.stream_threshold:
+                # Too big to buffer: stream it, holding one chunk at a time
+                self.metrics["jobs_streamed"] += 1
+                return self._deliver(
+                    source_printer,
+                    job_id,
+                    doc_name,
+                    self._transformed(
+                        header, lambda: self._iter_spool_chunks(spool_file)
+                    ),
+                    size,
+                    datatype,
+                )
+
+            with self.memory_budget.reserve(size):
+                with open(spool_file, "rb") as f:
+                    spool_data = f.read()
+                if not spool_data:
+                    self.log(f"Could not read job {job_id}")
+                    self.metrics["jobs_failed"] += 1
+                    return False
+                return self._deliver(
+                    source_printer,
+                    job_id,
+                    doc_name,
+                    self._transformed(header, lambda: [spool_data]),
+                    len(spool_data),
+                    datatype,
+                )
+        except DestinationsHeld:
+            raise
+        except Exception as e:
+            self.log(f"Error copying job {job_id}: {e}")
+        self.metrics["jobs_failed"] += 1
+        return False
+
+    def _deliver(
+        self,
+        source_printer: str,
+        job_id: int,
+        doc_name: str,
+        chunks: Callable[[], Iterable[bytes]],
+        size: Optional[int],
+        datatype: str = "RAW",
+        capture: bool = True,
+    ) -> bool:
+        """Send a job's data to the first healthy destination.
+
+        `chunks` is called once per attempt so a failed destination can be
+        retried on the next one from the start of the data. Capture
+        destinations get their copy after the print destination, unless
+        `capture` is False. `size` is None when the job is followed while
+        still spooling. Raises DestinationsHeld, before any capture, when
+        the only destinations that take `datatype` are paused by their
+        breakers.
+        """
+        delivered = False
+        accepted = attempted = False
+        for dest in self.destinations:
+            if not self.sinks[dest].accepts(datatype):
+                continue
+            accepted = True
+            if not self.breakers[dest].allow():
+                continue
+            attempted = True
+            try:
+                new_job_id = self.sinks[dest].send(
+                    doc_name, chunks(), datatype, source_printer, job_id
+                )
+            except SpoolFollowError:
+                # The source failed, not the destination; free the probe slot
+                self.breakers[dest].record_neutral()
+                raise
+            except Exception as e:
+                self.log(f"Error copying job {job_id} to {dest}: {e}")
+                self._record_dest_result(dest, False)
+                continue
+            self._record_dest_result(dest, True)
+
+            if dest != self.dest_printer:
+                self.metrics["failovers"] += 1
+                self.log(
+                    f"FAILOVER: [{source_printer}] Job {job_id} redirected "
+                    f"{self.dest_printer} -> {dest}"
+                )
+            self.metrics["jobs_copied"] += 1
+            if self.recorder is not None:
+                self.recorder.delivered(source_printer, job_id, dest)
+            detail = f"{size} bytes" if size is not None else "followed"
+            self.log(
+                f"OK: [{source_printer}] Job {job_id} -> {dest} (new: {new_job_id}, {detail})"
+            )
+            delivered = True
+            break
+        else:
+            if accepted and not attempted:
+                self.metrics["jobs_held"] += 1
+                raise DestinationsHeld(f"No destination available for job {job_id}")
+            if accepted:
+                self.log(f"No healthy destination for job {job_id}")
+            else:
+                self.log(f"No destination accepts {datatype} for job {job_id}")
+            self.metrics["jobs_failed"] += 1
+
+        if capture:
+            self._capture(source_printer, job_id, doc_name, chunks, datatype)
+        return delivered
+
+    def accepting(self, datatype: str) -> bool:
+        """Whether any destination takes jobs of `datatype` at all."""
+        return any(self.sinks[dest].accepts(datatype) for dest in self.destinations)
+
+    def _capture(
+        self,
+        source_printer: str,
+        job_id: int,
+        doc_name: str,
+        chunks: Callable[[], Iterable[bytes]],
+        datatype: str,
+    ):
+        """Give each capture destination its copy of a job."""
+        for dest in self.capture_to:
+            try:
+                ref = self.sinks[dest].send(
+                    doc_name, chunks(), datatype, source_printer, job_id
+                )
+                self.metrics["jobs_captured"] += 1
+                self.log(f"Captured: [{source_printer}] Job {job_id} -> {dest} ({ref})")
+            except Exception as e:
+                self.metrics["capture_failures"] += 1
+                self.log(f"Error capturing job {job_id} to {dest}: {e}")
+
+    def _get_current_jobs(self, printer_name: str) -> dict:
+        """Get current jobs from a printer."""
+        jobs = {}
+        try:
+            handle = win32print.OpenPrinter(printer_name)
+            try:
+                job_list = win32print.EnumJobs(handle, 0, -1, 2)
+                for job in job_list:
+                    job_id = job.get("JobId", 0)
+                    jobs[job_id] = {
+                        "document": job.get("pDocument") or "Unknown",
+                        "status": job.get("Status", 0),
+                        "size": job.get("Size", 0),
+                        "submitted": _submitted_ms(job.get("Submitted")),
+                        "owner": job.get("pUserName") or "",
+                        "machine": job.get("pMachineName") or "",
+                        "datatype": job.get("pDatatype") or "",
+                        "pages": job.get("TotalPages", 0),
+                    }
+            finally:
+                win32print.ClosePrinter(handle)
+        except Exception:
+            pass
+        return jobs
+
+    def _enumerate(self, printers: List[str]) -> Dict[str, dict]:
+        """Fetch the job lists of `printers`, several at a time.
+
+        Each EnumJobs call gets `enum_timeout` seconds from the moment it
+        starts. A source that runs over is left out of the result and is not
+        queried again until its stuck call returns, so one unreachable print
+        server cannot hold up the others.
+        """
+        if self.enum_workers <= 1:
+            return {p: self._get_current_jobs(p) for p in printers}
+        if self._enum_pool is None:
+            self._enum_pool = ThreadPoolExecutor(
+                self.enum_workers, thread_name_prefix="enum"
+            )
+
+        started: Dict[str, float] = {}
+
+        def fetch(printer: str) -> dict:
+            started[printer] = time.monotonic()
+            try:
+                return self._get_current_jobs(printer)
+            finally:
+                self._enum_busy.discard(printer)
+
+        futures = {}
+        for printer in printers:
+            if printer in self._enum_busy:
+                self.metrics["enum_skipped"] += 1
+                continue
+            self._enum_busy.add(printer)
+            futures[self._enum_pool.submit(fetch, printer)] = printer
+
+        results: Dict[str, dict] = {}
+        # Every call gets its turn even when all workers are busy
+        rounds = -(-len(futures) // self.enum_workers) + 1
+        deadline = time.monotonic() + self.enum_timeout * rounds
+        waiting = set(futures)
+        while waiting:
+            done, waiting = wait(
+                waiting,
+                timeout=max(0.05, self.enum_timeout / 4),
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                results[futures[future]] = future.result()
+            now = time.monotonic()
+            for future in list(waiting):
+                printer = futures[future]
+                began = started.get(printer)
+                if (began is not None and now - began > self.enum_timeout) or (
+                    now > deadline
+                ):
+                    waiting.discard(future)
+                    if future.cancel():
+                        self._enum_busy.discard(printer)
+                    self.metrics["enum_timeouts"] += 1
+                    self.log(
+                        f"[{printer}] Job list not returned within "
+                        f"{self.enum_timeout:.0f}s, skipped this scan"
+                    )
+        return results
+
+    def _collect_new_jobs(self) -> Dict[str, List[tuple]]:
+        """Enumerate every due source and return its new (job_id, info) pairs."""
+        now = time.monotonic()
+        due = [p for p in self.source_printers if self.schedules[p].due(now)]
+        current = self._enumerate(due) if self.running else {}
+
+        pending: Dict[str, List[tuple]] = {}
+        for printer in due:
+            if printer not in current:
+                continue
+            schedule = self.schedules[printer]
+            new_jobs = self._diff_jobs(printer, current[printer])
+            if self.standing_by():
+                # No backing off, so a takeover is noticed within one interval
+                schedule.hold(time.monotonic())
+            else:
+                schedule.update(bool(new_jobs), time.monotonic())
+            if self.shortest_job_first:
+                new_jobs.sort(key=lambda j: (j[1].get("size", 0), j[0]))
+            if new_jobs:
+                pending[printer] = new_jobs
+        return pending
+
+    def standing_by(self) -> bool:
+        """Whether this node is an HA standby, leaving the copying to the leader."""
+        return self.ha is not None and not self.ha.leader
+
+    def _diff_jobs(self, printer: str, current_jobs: dict) -> List[tuple]:
+        """Return the (job_id, info) pairs of `printer` not yet processed."""
+        if self.recorder is not None:
+            self.recorder.snapshot(printer, current_jobs)
+        self.last_jobs[printer] = current_jobs
+        if self.ha is not None and not self.ha.leading():
+            # Standby: the job list stays fresh, the leader copies
+            return []
+        processed = self.processed_jobs.setdefault(printer, JobTracker())
+
+        job_filter = self.job_filter
+        new_jobs = []
+        for job_id in sorted(processed.diff(current_jobs)):
+            info = current_jobs[job_id]
+            if info["document"].startswith("[MIRROR"):
+                processed.mark(job_id, info)
+                continue
+            if job_filter:
+                if job_filter.needs_complete and info["status"] & JOB_STATUS_SPOOLING:
+                    # Size and page count are not final yet; look again later
+                    continue
+                reason = job_filter.match(info)
+                if reason is not None:
+                    self.metrics[f"filtered_{reason}"] += 1
+                    self.logger.debug(
+                        f"Filtered ({reason}): [{printer}] [{job_id}] {info['document']}"
+                    )
+                    processed.mark(job_id, info)
+                    continue
+            new_jobs.append((job_id, info))
+        return new_jobs
+
+    def _schedule(self, pending: Dict[str, List[tuple]]):
+        """Yield (printer, job_id, info) interleaved round-robin across sources."""
+        order = [p for p in self.source_printers if p in pending]
+        if order:
+            shift = self._rr_offset % len(order)
+            order = order[shift:] + order[:shift]
+        self._rr_offset += 1
+
+        queues = [(p, iter(pending[p])) for p in order]
+        while queues:
+            for entry in list(queues):
+                printer, jobs = entry
+                job = next(jobs, None)
+                if job is None:
+                    queues.remove(entry)
+                    continue
+                yield printer, job[0], job[1]
+
+    def run_once(self) -> int:
+        """Execute one iteration of the mirror. Returns number of jobs copied."""
+        copied = 0
+        started = time.monotonic()
+        polled = any(s.due(started) for s in self.schedules.values())
+        pending = self._collect_new_jobs()
+        backlog = sum(len(jobs) for jobs in pending.values())
+
+        for printer, job_id, job_info in self._schedule(pending):
+            if not self.running:
+                break
+            if (
+                self.max_scan_seconds
+                and time.monotonic() - started >= self.max_scan_seconds
+            ):
+                # Remaining jobs stay unprocessed and are picked up next scan
+                self.metrics["scan_yields"] += 1
+                break
+            if self.backpressure is not None and self.backpressure.saturated():
+                # Held in the source queue until the destination drains
+                break
+            if self.ha is not None and not self.ha.leader:
+                # Lost the lock during the scan; the new leader copies the rest
+                break
+            try:
+                if self.process_job(printer, job_id, job_info):
+                    copied += 1
+            except DestinationsHeld as e:
+                # Left unmarked, like jobs held by backpressure, and tried
+                # again once a breaker lets a probe through
+                self.log(f"{e}, holding it")
+                break
+            backlog -= 1
+            self.processed_jobs[printer].mark(job_id, job_info)
+
+        self.metrics["backlog"] = backlog
+        if self.watchdog is not None and polled:
+            # The whole pass, copies included, against the polling interval
+            self.watchdog.scan_finished(time.monotonic() - started)
+        if copied and self.ha is not None:
+            # Publish the copies now, so a takeover does not repeat them
+            self.ha.check()
+        if self.profiler is not None:
+            self.profiler.tick()
+        self.write_status()
+        return copied
+
+    def process_job(self, printer: str, job_id: int, job_info: dict) -> bool:
+        """Mirror one detected job. Marking it as handled is up to the caller.
+
+        Raises DestinationsHeld if no destination may take it right now; the
+        caller then leaves it unmarked so a later scan picks it up again.
+        """
+        document = job_info["document"]
+        self.log(f"New job: [{printer}] [{job_id}] {document}")
+        spooling = bool(job_info["status"] & JOB_STATUS_SPOOLING)
+        if not (spooling and self.tail_follow):
+            time.sleep(self.settle_delay)
+
+        if not self._copy_job(printer, job_id, document, spooling):
+            return False
+        if self.watchdog is not None:
+            self.watchdog.job_finished(printer, job_id, job_info["submitted"])
+        return True
+
+    def poll_delay(self) -> float:
+        """Seconds until the next source is due for polling."""
+        if not self.schedules:
+            return self.interval
+        next_poll = min(s.next_poll for s in self.schedules.values())
+        return max(0.05, next_poll - time.monotonic())
+
+    def status(self) -> dict:
+        """Snapshot of the running mirror for `status` and the GUI."""
+        return {
+            "updated": time.time(),
+            "pid": os.getpid(),
+            "sources": {
+                printer: {
+                    "interval": round(schedule.current, 2),
+                    "last_activity": schedule.last_activity or None,
+                }
+                for printer, schedule in self.schedules.items()
+            },
+            "destinations": {
+                dest: breaker.state for dest, breaker in self.breakers.items()
+            },
+            "queue_depth": (
+                dict(self.backpressure.depths) if self.backpressure is not None else {}
+            ),
+            "metrics": dict(self.metrics),
+            "slo": self.watchdog.status() if self.watchdog is not None else None,
+            "ha": self.ha.status() if self.ha is not None else None,
+        }
+
+    def write_status(self, force: bool = False):
+        """Write status() to status_path, at most every 5 seconds."""
+        if self.status_path is None:
+            return
+        if not force and time.monotonic() - self._status_written < 5.0:
+            return
+        self._status_written = time.monotonic()
+        try:
+            temp_path = self.status_path.with_suffix(".tmp")
+            with open(temp_path, "w") as f:
+                json.dump(self.status(), f, indent=2)
+            os.replace(temp_path, self.status_path)
+        except OSError as e:
+            self.log(f"Error writing status: {e}")
+
+    def prepare(self) -> bool:
+        """Check spool access, ignore existing jobs and start listeners."""
+        try:
+            os.listdir(self.spool_dir)
+        except PermissionError:
+            self.log(
+                "ERROR: No access to spool directory. Run as Administrator/SYSTEM."
+            )
+            return False
+
+        # Initialize processed jobs for all source printers
+        for printer in self.source_printers:
+            existing_jobs = self._get_current_jobs(printer)
+            if self.recorder is not None:
+                self.recorder.snapshot(printer, existing_jobs)
+            self.processed_jobs[printer].reset(existing_jobs)
+            self.log(f"[{printer}] Ignoring {len(existing_jobs)} existing job(s)")
+
+        if self.ingest is not None:
+            self.ingest.start()
+        if self.relay is not None:
+            self.relay.start()
+        if self.retention is not None:
+            self.retention.start()
+        if self.ha is not None:
+            self.ha.start()
+        return True
+
+    def run(self):
+        """Run the main mirror loop."""
+        self.running = True
+        sources_str = ", ".join(self.source_printers)
+        self.log(f"Mirror started: [{sources_str}] -> {self.dest_printer}")
+
+        if self.profiler is not None:
+            self.profiler.start()
+        if not self.prepare():
+            return
+
+        while self.running:
+            self.run_once()
+            time.sleep(self.poll_delay())
+
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.close()
+        self.log("Mirror stopped")
+
+    def stop(self):
+        """Stop the mirror service."""
+        self.running = False
+
+    def close(self):
+        """Stop background threads and release destination connections."""
+        if self.ingest is not None:
+            self.ingest.stop()
+        if self.relay is not None:
+            self.relay.stop()
+        if self.retention is not None:
+            self.retention.stop()
+        if self.ha is not None:
+            self.ha.release()
+        if self._enum_pool is not None:
+            self._enum_pool.shutdown(wait=False)
+            self._enum_pool = None
+        for sink in self.sinks.values():
+            try:
+                sink.close()
+            except Exception as e:
+                self.log(f"Error closing destination {sink.name}: {e}")
+
+
+class RetentionManager:
+    """Deletes mirrored jobs from the source queues in the background.
+
+    A job is deleted once it has been handled by the mirror and is older
+    than `max_age_minutes`, or when the queue holds more than `max_jobs`
+    handled jobs (oldest first). Works from the job lists the mirror loop
+    already fetched and deletes in small batches, so it never delays
+    detection of new jobs.
+    """
+
+    def __init__(
+        self,
+        core: "PrinterMirrorCore",
+        max_age_minutes: float = 60,
+        max_jobs: int = 200,
+        only_printed: bool = True,
+        interval: float = 60.0,
+        batch_size: int = 20,
+        batch_pause: float = 0.5,
+    ):
+        self.core = core
+        self.max_age = max_age_minutes * 60.0
+        self.max_jobs = max_jobs
+        self.only_printed = only_printed
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.batch_pause = batch_pause
+        self.thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        # Deleted ids still listed in the (older) snapshot of the mirror loop
+        self._deleted: Dict[str, Set[int]] = {}
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(5.0)
+            self.thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            for printer in self.core.source_printers:
+                if self._stop.is_set():
+                    return
+                try:
+                    self.purge(printer)
+                except Exception as e:
+                    self.core.log(f"Retention error on {printer}: {e}")
+
+    def select(self, printer: str, now_ms: Optional[int] = None) -> List[int]:
+        """Return the job ids of `printer` that are due for deletion."""
+        jobs = self.core.last_jobs.get(printer) or {}
+        tracker = self.core.processed_jobs.get(printer)
+        if tracker is None:
+            return []
+        if self.core.ha is not None and not self.core.ha.leader:
+            return []
+        now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+        done = JOB_STATUS_PRINTED | JOB_STATUS_COMPLETE
+        deleted = self._deleted.setdefault(printer, set())
+        deleted &= set(jobs)
+
+        handled = sorted(
+            (info["submitted"], job_id)
+            for job_id, info in jobs.items()
+            if job_id not in deleted
+            and tracker.stamps.get(job_id) == info["submitted"]
+            and (not self.only_printed or info["status"] & done)
+        )
+        excess = len(handled) - self.max_jobs if self.max_jobs else 0
+        return [
+            job_id
+            for index, (submitted, job_id) in enumerate(handled)
+            if index < excess or (submitted and now_ms - submitted > self.max_age * 1000)
+        ]
+
+    def purge(self, printer: str) -> int:
+        """Delete due jobs of one source in batches. Returns the count."""
+        due = self.select(printer)
+        if not due:
+            return 0
+        deleted = 0
+        handle = win32print.OpenPrinter(
+            printer, {"DesiredAccess": win32print.PRINTER_ACCESS_ADMINISTER}
+        )
+        try:
+            for start in range(0, len(due), self.batch_size):
+                for job_id in due[start : start + self.batch_size]:
+                    try:
+                        win32print.SetJob(
+                            handle, job_id, 0, None, win32print.JOB_CONTROL_DELETE
+                        )
+                        self._deleted[printer].add(job_id)
+                        deleted += 1
+                    except Exception:
+                        # Already gone or still in use; retried next round
+                        pass
+                if self._stop.wait(self.batch_pause):
+                    break
+        finally:
+            win32print.ClosePrinter(handle)
+        if deleted:
+            self.core.metrics["jobs_purged"] += deleted
+            self.core.log(f"Retention: deleted {deleted} old job(s) from {printer}")
+        return deleted
+
+
+class Backpressure:
+    """Holds back new jobs while the destination queue is too deep.
+
+    The destination counts as saturated once its queue reaches
+    `high_watermark` jobs and stays so until it drains to `low_watermark`.
+    The depth is queried at most every `check_interval` seconds. Held jobs
+    wait in the source queue (or the async engine's queue) meanwhile.
+    """
+
+    def __init__(
+        self,
+        core: "PrinterMirrorCore",
+        high_watermark: int = 20,
+        low_watermark: int = 5,
+        check_interval: float = 2.0,
+    ):
+        self.core = core
+        self.high_watermark = high_watermark
+        self.low_watermark = min(low_watermark, high_watermark)
+        self.check_interval = check_interval
+        self.depths: Dict[str, int] = {}
+        self._checked: Dict[str, float] = {}
+        self._saturated: Set[str] = set()
+
+    def target(self) -> Optional[str]:
+        """The destination the next job would go to."""
+        for dest in self.core.destinations:
+            if self.core.breakers[dest].state != CircuitBreaker.OPEN:
+                return dest
+        return None
+
+    def saturated(self) -> bool:
+        dest = self.target()
+        if dest is None:
+            return False
+        now = time.monotonic()
+        if now - self._checked.get(dest, 0.0) >= self.check_interval:
+            self._checked[dest] = now
+            try:
+                depth = self.core.sinks[dest].queue_depth()
+            except Exception:
+                depth = None
+            if depth is not None:
+                self.depths[dest] = depth
+                self._update(dest, depth)
+        return dest in self._saturated
+
+    def _update(self, dest: str, depth: int):
+        if dest not in self._saturated and depth >= self.high_watermark:
+            self._saturated.add(dest)
+            self.core.metrics["backpressure_pauses"] += 1
+            self.core.log(
+                f"Destination {dest} has {depth} queued job(s), holding new jobs"
+            )
+        elif dest in self._saturated and depth <= self.low_watermark:
+            self._saturated.discard(dest)
+            self.core.log(f"Destination {dest} drained to {depth} job(s), resuming")
+
+
+class SloWatchdog:
+    """Checks scan duration and job lag against service-level objectives.
+
+    A pass of the mirror loop (listing the sources and copying what is new)
+    slower than `scan_seconds`, or a job mirrored more than
+    `job_lag_seconds` after it was submitted, is a violation. Every violation is counted; a warning is logged and written
+    to the Windows event log at most once per `alert_interval` per kind.
+    status() reports "violated" until `clear_after` seconds pass without one.
+    """
+
+    def __init__(
+        self,
+        core: "PrinterMirrorCore",
+        scan_seconds: float = 0,
+        job_lag_seconds: float = 60.0,
+        alert_interval: float = 300.0,
+        clear_after: float = 300.0,
+        event_log: bool = True,
+    ):
+        self.core = core
+        self.scan_seconds = scan_seconds or core.interval
+        self.job_lag_seconds = job_lag_seconds
+        self.alert_interval = alert_interval
+        self.clear_after = clear_after
+        self.event_log = event_log and SERVICE_AVAILABLE
+        self.last_scan = 0.0
+        self.last_lag = 0.0
+        self.last_violation: Optional[str] = None
+        self._violated_at = 0.0
+        # kind -> (time of last alert, violations since then)
+        self._alerts: Dict[str, Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def scan_finished(self, duration: float):
+        self.last_scan = duration
+        if duration > self.scan_seconds:
+            self._violation(
+                "scan",
+                f"Scan took {duration:.1f}s (SLO {self.scan_seconds:.1f}s)",
+            )
+
+    def job_finished(self, printer: str, job_id: int, submitted_ms: int):
+        if not submitted_ms:
+            return
+        lag = max(0.0, time.time() - submitted_ms / 1000.0)
+        self.last_lag = lag
+        if lag > self.job_lag_seconds:
+            self._violation(
+                "lag",
+                f"[{printer}] Job {job_id} mirrored {lag:.0f}s after it was "
+                f"printed (SLO {self.job_lag_seconds:.0f}s)",
+            )
+
+    def _violation(self, kind: str, message: str):
+        self.core.metrics[f"slo_{kind}_violations"] += 1
+        now = time.monotonic()
+        with self._lock:
+            self.last_violation = message
+            self._violated_at = now
+            alerted, suppressed = self._alerts.get(kind, (0.0, 0))
+            if alerted and now - alerted < self.alert_interval:
+                self._alerts[kind] = (alerted, suppressed + 1)
+                return
+            self._alerts[kind] = (now, 0)
+        if suppressed:
+            message += f" ({suppressed} more since last warning)"
+        self.core.logger.warning(f"SLO violated: {message}")
+        if self.event_log:
+            try:
+                servicemanager.LogWarningMsg(f"{APP_NAME}: SLO violated: {message}")
+            except Exception:
+                pass
+
+    def violated(self) -> bool:
+        return bool(self._violated_at) and (
+            time.monotonic() - self._violated_at < self.clear_after
+        )
+
+    def status(self) -> dict:
+        return {
+            "state": "violated" if self.violated() else "ok",
+            "last_violation": self.last_violation if self.violated() else None,
+            "scan_seconds": round(self.last_scan, 3),
+            "job_lag_seconds": round(self.last_lag, 1),
+        }
+
+
+class LeaseLock:
+    """Leader lock kept as a lease file, e.g. on a share both nodes reach.
+
+    The holder rewrites the small lease file each time it renews. Another
+    node takes over once the file has not changed for `lease_seconds` by its
+    own clock, so the machines' clocks do not have to agree. If two
+    standbys take over at the same moment, the one that wrote last keeps
+    the lease and the other steps back at its next renewal. The published
+    state goes to `<path>.state`, rewritten only when it changed.
+    """
+
+    def __init__(self, path: str, node: str, lease_seconds: float = 10.0):
+        self.path = Path(path)
+        self.state_path = self.path.with_name(self.path.name + ".state")
+        self.node = node
+        self.lease_seconds = lease_seconds
+        self._serial = 0
+        # (owner, serial) of the last foreign record read, and when it changed
+        self._seen: Optional[Tuple[str, int]] = None
+        self._seen_at = 0.0
+        # Id of the state this node last wrote, and of the last one it read
+        self._state_id = ""
+        self._state_read: Optional[Tuple[str, str]] = None
+
+    def _lease(self) -> Optional[dict]:
+        try:
+            return json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            raise OSError(f"unreadable lease file {self.path}: {e}")
+
+    def peek(self) -> Optional[dict]:
+        """The current lease record, or None if there is none yet.
+
+        Carries the holder's state only when it changed since the last peek.
+        """
+        record = self._lease()
+        if record is None or not record.get("state_id"):
+            return record
+        key = (record["owner"], record["state_id"])
+        if key != self._state_read:
+            try:
+                record["state"] = json.loads(self.state_path.read_text())
+            except FileNotFoundError:
+                return record
+            except ValueError as e:
+                raise OSError(f"unreadable state file {self.state_path}: {e}")
+            self._state_read = key
+        return record
+
+    def acquire(self, state: Optional[dict]) -> bool:
+        """Take or renew the lease, publishing `state` unless it is None.
+
+        False if the lease is held elsewhere.
+        """
+        record = self._lease()
+        if record is not None and record["owner"] != self.node:
+            if not record.get("released"):
+                seen = (record["owner"], record["serial"])
+                now = time.monotonic()
+                if seen != self._seen:
+                    self._seen, self._seen_at = seen, now
+                if now - self._seen_at < self.lease_seconds:
+                    return False
+        self._write(state)
+        return True
+
+    def release(self, state: dict):
+        """Give up the lease at once, leaving `state` for the next leader."""
+        record = self._lease()
+        if record is None or record["owner"] == self.node:
+            self._write(state, released=True)
+
+    def _write(self, state: Optional[dict], **fields):
+        if state is not None:
+            # The state first, so a lease naming it never points at an older one
+            temp_path = self.state_path.with_name(
+                f"{self.state_path.name}.{self.node}.tmp"
+            )
+            temp_path.write_text(json.dumps(state))
+            os.replace(temp_path, self.state_path)
+            self._state_id = f"{time.time():.6f}"
+        self._serial += 1
+        record = {
+            "owner": self.node,
+            "serial": self._serial,
+            "state_id": self._state_id,
+            **fields,
+        }
+        temp_path = self.path.with_name(f"{self.path.name}.{self.node}.tmp")
+        temp_path.write_text(json.dumps(record))
+        os.replace(temp_path, self.path)
+
+
+class FileLock:
+    """Leader lock held as an OS lock on a file, e.g. on a share.
+
+    The OS drops the lock when the holder exits or its machine falls off the
+    network, so failover does not wait for a lease to run out. The holder
+    publishes its state in `<path>.state` next to the lock file.
+    """
+
+    def __init__(self, path: str, node: str, lease_seconds: float = 10.0):
+        self.path = Path(path)
+        self.state_path = self.path.with_name(self.path.name + ".state")
+        self.node = node
+        self._file = None
+
+    def peek(self) -> Optional[dict]:
+        try:
+            return json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            raise OSError(f"unreadable state file {self.state_path}: {e}")
+
+    def _lock(self) -> bool:
+        f = open(self.path, "a+b")
+        try:
+            f.seek(0)
+            if os.name == "nt":
+                import msvcrt
+
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def acquire(self, state: Optional[dict]) -> bool:
+        """Take or keep the lock, publishing `state` unless it is None."""
+        if self._file is None and not self._lock():
+            return False
+        temp_path = self.state_path.with_suffix(".tmp")
+        try:
+            if state is None:
+                # Nothing new to publish; still make sure the share is there
+                self.state_path.stat()
+            else:
+                temp_path.write_text(json.dumps({"owner": self.node, "state": state}))
+                os.replace(temp_path, self.state_path)
+        except OSError:
+            # The share is gone; so is any claim to the lock
+            self._file.close()
+            self._file = None
+            raise
+        return True
+
+    def release(self, state: dict):
+        if self._file is None:
+            return
+        try:
+            self.acquire(state)
+        finally:
+            # Closing the handle drops the lock
+            self._file.close()
+            self._file = None
+
+
+LEADER_LOCKS = {"lease": LeaseLock, "file": FileLock}
+
+
+class HighAvailability:
+    """Active/standby coordination between mirrors of the same queues.
+
+    Only the node holding the leader lock copies jobs. Every `interval` a
+    background thread renews the lock, also in the middle of a long scan,
+    and the leader publishes its handled-job set with it. A
+    standby keeps enumerating its sources and keeps its destinations open,
+    but copies nothing; instead it loads the leader's handled-job set. When
+    the lock comes free it takes over at its next check and copies only the
+    jobs the old leader had not handled. Jobs the old leader copied after
+    its last renewal are copied again, never lost.
+    """
+
+    def __init__(
+        self,
+        core: "PrinterMirrorCore",
+        path: str,
+        lock: str = "lease",
+        node: str = "",
+        lease_seconds: float = 30.0,
+    ):
+        if lock not in LEADER_LOCKS:
+            raise ValueError(f"Unknown leader lock type: {lock}")
+        if not path:
+            raise ValueError("ha needs a lock path both nodes can reach")
+        if lock == "lease" and lease_seconds <= core.max_scan_seconds:
+            raise ValueError(
+                f"ha lease_seconds ({lease_seconds}) must be longer than "
+                f"max_scan_seconds ({core.max_scan_seconds})"
+            )
+        self.core = core
+        self.node = node or socket.gethostname()
+        self.lock = LEADER_LOCKS[lock](path, self.node, lease_seconds)
+        self.interval = min(core.interval, lease_seconds / 3)
+        self.leader = False
+        self.holder: Optional[str] = None
+        self._checked = 0.0
+        # The handled-job set as last written to the share
+        self._published: Optional[dict] = None
+        # check() runs on the renew thread and after copies on the mirror loop
+        self._lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, name="ha", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(5.0)
+            self.thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.core.log(f"HA check failed: {e}")
+
+    def _state(self) -> dict:
+        # Copied first: the mirror loop keeps marking jobs meanwhile
+        return {
+            printer: {str(job_id): stamp for job_id, stamp in dict(tracker.stamps).items()}
+            for printer, tracker in list(self.core.processed_jobs.items())
+        }
+
+    def _adopt(self, record: Optional[dict]):
+        """Load the leader's handled-job set into this standby."""
+        if record is None:
+            return
+        self.holder = record.get("owner")
+        for printer, stamps in record.get("state", {}).items():
+            tracker = self.core.processed_jobs.get(printer)
+            if tracker is not None:
+                tracker.stamps = {int(job_id): stamp for job_id, stamp in stamps.items()}
+
+    def leading(self) -> bool:
+        """Whether this node should copy jobs; checks the lock every interval."""
+        if time.monotonic() - self._checked >= self.interval:
+            self.check()
+        return self.leader
+
+    def check(self) -> bool:
+        with self._lock:
+            return self._check()
+
+    def _check(self) -> bool:
+        self._checked = time.monotonic()
+        was_leader = self.leader
+        try:
+            if not was_leader:
+                self._adopt(self.lock.peek())
+                self._published = None
+            state = self._state()
+            # Renewing is cheap; the set itself only goes out when it changed
+            changed = state != self._published
+            self.leader = self.lock.acquire(state if changed else None)
+            if self.leader:
+                self._published = state
+        except OSError as e:
+            # Cannot prove we hold the lock, so let the other node have it
+            if was_leader:
+                self.core.logger.warning(f"HA: lock unreachable ({e}), standing by")
+            self.leader = False
+        if self.leader and not was_leader:
+            self.core.metrics["ha_takeovers"] += 1
+            previous = self.holder if self.holder != self.node else None
+            self.core.logger.warning(
+                f"HA: {self.node} is now the leader"
+                + (f" (took over from {previous})" if previous else "")
+            )
+            self.holder = self.node
+        elif was_leader and not self.leader:
+            self.core.logger.warning(f"HA: {self.node} lost the leader lock, standing by")
+        return self.leader
+
+    def release(self):
+        self.stop()
+        if not self.leader:
+            return
+        try:
+            self.lock.release(self._state())
+            self.core.log(f"HA: {self.node} released the leader lock")
+        except OSError as e:
+            self.core.log(f"HA: could not release the leader lock: {e}")
+        self.leader = False
+
+    def status(self) -> dict:
+        return {
+            "node": self.node,
+            "role": "leader" if self.leader else "standby",
+            "leader": self.node if self.leader else self.holder,
+        }
+
+
+def scoped_ha(config: dict, scope: str) -> dict:
+    """The `ha` config of one pipeline or shard: its own lock file."""
+    ha = {**DEFAULT_CONFIG["ha"], **config.get("ha", {})}
+    if ha["path"]:
+        path = Path(ha["path"])
+        ha["path"] = str(path.with_name(f"{path.stem}-{scope}{path.suffix}"))
+    return ha
+
+
+class AsyncMirrorEngine:
+    """Asyncio variant of the mirror loop with prompt cancellation.
+
+    Each source is polled by its own coroutine and new jobs are copied by
+    `workers` copy coroutines, which take jobs round-robin across sources.
+    Blocking win32 calls run in two thread pools, one for job lists and
+    queue queries and one for copies, so stuck print servers cannot hold up
+    copying; a job list that is not back within `enum_timeout` is skipped.
+    stop() cancels polling and waits at once, then gives copies that are
+    already writing `stop_timeout` seconds to finish.
+    """
+
+    def __init__(
+        self, core: PrinterMirrorCore, workers: int = 4, stop_timeout: float = 5.0
+    ):
+        self.core = core
+        self.workers = max(1, workers)
+        self.stop_timeout = stop_timeout
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._in_flight: Set[asyncio.Future] = set()
+        # New jobs per source, served round-robin by the copy coroutines
+        self._queues: Dict[str, deque] = {}
+        self._queued: Optional[asyncio.Event] = None
+        self._rr_offset = 0
+
+    def run(self):
+        """Run until stop() is called (from any thread)."""
+        self.core.running = True
+        asyncio.run(self._main())
+
+    def stop(self):
+        self.core.running = False
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._queued = asyncio.Event()
+        if not self.core.running:
+            return
+        if self.core.profiler is not None:
+            # Before the executors, so their threads are profiled too
+            self.core.profiler.start()
+        enum_executor = ThreadPoolExecutor(
+            max(1, self.core.enum_workers), thread_name_prefix="enum"
+        )
+        copy_executor = ThreadPoolExecutor(self.workers + 1, thread_name_prefix="mirror")
+        tasks: List[asyncio.Task] = []
+        try:
+            sources_str = ", ".join(self.core.source_printers)
+            self.core.log(
+                f"Mirror started (async): [{sources_str}] -> {self.core.dest_printer}"
+            )
+            if not await self.loop.run_in_executor(copy_executor, self.core.prepare):
+                return
+
+            self._queues = {printer: deque() for printer in self.core.source_printers}
+            tasks = [
+                asyncio.ensure_future(self._poll(printer, enum_executor))
+                for printer in self.core.source_printers
+            ]
+            tasks += [
+                asyncio.ensure_future(self._copy(enum_executor, copy_executor))
+                for _ in range(self.workers)
+            ]
+            if self.core.profiler is not None:
+                tasks.append(asyncio.ensure_future(self._tick_profiler()))
+            await self._stopping.wait()
+        finally:
+            self.core.running = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self._in_flight:
+                self.core.log(f"Waiting for {len(self._in_flight)} copy(ies) to finish")
+                _, pending = await asyncio.wait(
+                    self._in_flight, timeout=self.stop_timeout
+                )
+                if pending:
+                    self.core.log(f"{len(pending)} copy(ies) still running at stop")
+            enum_executor.shutdown(wait=False)
+            copy_executor.shutdown(wait=False)
+            if self.core.profiler is not None:
+                self.core.profiler.stop()
+            self.core.close()
+            self.core.log("Mirror stopped")
+
+    async def _poll(self, printer: str, executor):
+        schedule = self.core.schedules[printer]
+        call: Optional[asyncio.Future] = None
+        while True:
+            if call is not None and not call.done():
+                # The last job list never came back; don't pile up calls
+                self.core.metrics["enum_skipped"] += 1
+                await asyncio.sleep(schedule.update(False, time.monotonic()))
+                continue
+            started = time.monotonic()
+            call = self.loop.run_in_executor(
+                executor, self.core._get_current_jobs, printer
+            )
+            try:
+                # Shielded: the call keeps its thread until win32 returns
+                current_jobs = await asyncio.wait_for(
+                    asyncio.shield(call), self.core.enum_timeout
+                )
+            except asyncio.TimeoutError:
+                self.core.metrics["enum_timeouts"] += 1
+                self.core.log(
+                    f"[{printer}] Job list not returned within "
+                    f"{self.core.enum_timeout:.0f}s, skipped this scan"
+                )
+                await asyncio.sleep(schedule.update(False, time.monotonic()))
+                continue
+            call = None
+            if self.core.watchdog is not None:
+                self.core.watchdog.scan_finished(time.monotonic() - started)
+            new_jobs = self.core._diff_jobs(printer, current_jobs)
+            if self.core.shortest_job_first:
+                new_jobs.sort(key=lambda j: (j[1].get("size", 0), j[0]))
+            for job_id, job_info in new_jobs:
+                # Marked when queued so the next poll does not queue it again
+                self.core.processed_jobs[printer].mark(job_id, job_info)
+                self._queues[printer].append((job_id, job_info))
+            if new_jobs:
+                self._queued.set()
+            self.core.metrics["backlog"] = sum(len(q) for q in self._queues.values())
+            self.core.write_status()
+            if self.core.standing_by():
+                await asyncio.sleep(schedule.hold(time.monotonic()))
+            else:
+                await asyncio.sleep(schedule.update(bool(new_jobs), time.monotonic()))
+
+    async def _next_job(self) -> tuple:
+        """The next (printer, job_id, info), taking sources in turn."""
+        while True:
+            order = list(self._queues)
+            for _ in range(len(order)):
+                printer = order[self._rr_offset % len(order)]
+                self._rr_offset += 1
+                if self._queues[printer]:
+                    job_id, job_info = self._queues[printer].popleft()
+                    return printer, job_id, job_info
+            self._queued.clear()
+            await self._queued.wait()
+
+    async def _copy(self, enum_executor, copy_executor):
+        while True:
+            printer, job_id, job_info = await self._next_job()
+            backpressure = self.core.backpressure
+            while backpressure is not None and await self.loop.run_in_executor(
+                enum_executor, backpressure.saturated
+            ):
+                await asyncio.sleep(backpressure.check_interval)
+            document = job_info["document"]
+            self.core.log(f"New job: [{printer}] [{job_id}] {document}")
+            spooling = bool(job_info["status"] & JOB_STATUS_SPOOLING)
+            if not (spooling and self.core.tail_follow):
+                await asyncio.sleep(self.core.settle_delay)
+
+            future = self.loop.run_in_executor(
+                copy_executor, self.core._copy_job, printer, job_id, document, spooling
+            )
+            self._in_flight.add(future)
+            future.add_done_callback(self._in_flight.discard)
+            try:
+                # Shielded: cancelling this coroutine leaves the write running
+                copied = await asyncio.shield(future)
+            except DestinationsHeld as e:
+                # Unmarked, so the next poll of this source queues it again
+                self.core.log(f"{e}, holding it")
+                self.core.processed_jobs[printer].unmark(job_id)
+                continue
+            if copied and self.core.watchdog is not None:
+                self.core.watchdog.job_finished(
+                    printer, job_id, job_info["submitted"]
+                )
+
+    async def _tick_profiler(self):
+        while True:
+            await asyncio.sleep(self.core.interval)
+            self.core.profiler.tick()
+
+
+class RelayReceiver:
+    """Accepts batches from RelaySink senders and prints them locally.
+
+    Runs an asyncio loop in a background thread, one connection per sending
+    site. Each job of a batch goes through the core's destinations, and the
+    batch is acknowledged up to the last job delivered. The last number per
+    site is kept in `state_path`, so a batch resent after a lost
+    acknowledgement is not printed twice. A job that can never print here
+    is moved to `dead_letter_dir` and passed over; one that cannot print
+    right now (every destination failing or paused) ends the batch, and the
+    sender resends it.
+    """
+
+    def __init__(
+        self,
+        core: PrinterMirrorCore,
+        host: str = "0.0.0.0",
+        port: int = 9700,
+        token: str = "",
+        max_batch_mb: float = 64,
+        state_path: Optional[Path] = None,
+        dead_letter_dir: str = "",
+        tls_cert: str = "",
+        tls_key: str = "",
+    ):
+        if not token:
+            raise ValueError("relay_receiver needs a token; it would print jobs from anyone")
+        self.core = core
+        self.host = host
+        self.port = port
+        self.token = token
+        self.max_batch = int(max_batch_mb * 1024 * 1024)
+        self.state_path = state_path or RELAY_DIR / "received.json"
+        self.dead_letter_dir = (
+            Path(dead_letter_dir) if dead_letter_dir else RELAY_DIR / "dead-letter"
+        )
+        self.ssl_context: Optional[ssl.SSLContext] = None
+        if tls_cert:
+            self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.ssl_context.load_cert_chain(tls_cert, tls_key or None)
+        self.state: Dict[str, int] = {}
+        if self.state_path.exists():
+            try:
+                self.state = json.loads(self.state_path.read_text())
+            except (OSError, ValueError):
+                self.core.log(f"Relay state {self.state_path} unreadable, starting over")
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def start(self):
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(ready,), name="relay-receiver", daemon=True
+        )
+        self.thread.start()
+        ready.wait(10)
+
+    def stop(self, timeout: float = 5.0):
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self, ready: threading.Event):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve(ready))
+        except Exception as e:
+            self.core.log(f"Relay receiver failed: {e}")
+        finally:
+            ready.set()
+            self.loop.close()
+
+    async def _serve(self, ready: threading.Event):
+        self._stopping = asyncio.Event()
+        # One print thread, so jobs from a site print in the order sent
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="relay-print")
+        server = await asyncio.start_server(
+            self._handle, self.host, self.port, ssl=self.ssl_context
+        )
+        self.port = server.sockets[0].getsockname()[1]
+        try:
+            self.core.log(f"Relay receiver listening on {self.host}:{self.port}")
+            ready.set()
+            await self._stopping.wait()
+        finally:
+            server.close()
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._executor.shutdown(wait=True)
+
+    async def _frame(self, reader: asyncio.StreamReader) -> Tuple[bytes, bytes]:
+        header = await reader.readexactly(5)
+        size = int.from_bytes(header[:4], "big")
+        if size > self.max_batch:
+            raise ValueError(f"batch of {size} bytes is over the limit")
+        return header[4:5], await reader.readexactly(size)
+
+    @staticmethod
+    def _reply(writer: asyncio.StreamWriter, kind: bytes, payload: bytes = b""):
+        writer.write(len(payload).to_bytes(4, "big") + kind + payload)
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        site = None
+        try:
+            kind, payload = await self._frame(reader)
+            hello = json.loads(payload) if kind == b"H" else {}
+            if not hmac.compare_digest(hello.get("token", ""), self.token):
+                self._reply(writer, b"E", b"relay token rejected")
+                await writer.drain()
+                return
+            site = hello["site"]
+            self.core.log(f"Relay from {site} ({peer[0]}) connected")
+            self._reply(writer, b"A", json.dumps({"seq": self.state.get(site, 0)}).encode())
+            await writer.drain()
+
+            while True:
+                kind, payload = await self._frame(reader)
+                if kind == b"P":
+                    self._reply(writer, b"P")
+                elif kind in (b"B", b"Z"):
+                    if kind == b"Z":
+                        # max_batch bounds the batch after decompression too
+                        inflater = zlib.decompressobj()
+                        payload = inflater.decompress(payload, self.max_batch)
+                        if inflater.unconsumed_tail:
+                            raise ValueError("batch is over the limit once decompressed")
+                    seq = await self.loop.run_in_executor(
+                        self._executor, self._print_batch, site, payload
+                    )
+                    self._reply(writer, b"A", json.dumps({"seq": seq}).encode())
+                else:
+                    raise ValueError(f"unexpected relay frame {kind!r}")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.CancelledError, ConnectionError):
+            # Sender went away, or the receiver is stopping; the sender
+            # resends anything not acknowledged yet
+            pass
+        except Exception as e:
+            self.core.log(f"Relay from {site or peer[0]} failed: {e}")
+        finally:
+            writer.close()
+
+    def _print_batch(self, site: str, payload: bytes) -> int:
+        """Deliver the jobs of one batch. Returns the last sequence delivered."""
+        done = self.state.get(site, 0)
+        offset = 0
+        while offset < len(payload):
+            size = int.from_bytes(payload[offset : offset + 8], "big")
+            record = payload[offset + 8 : offset + 8 + size]
+            offset += 8 + size
+            header_size = int.from_bytes(record[:4], "big")
+            header = json.loads(record[4 : 4 + header_size])
+            if header["seq"] <= done:
+                continue  # already printed before a lost acknowledgement
+            data = record[4 + header_size :]
+            self.core.metrics["relay_received"] += 1
+            source = f"{site}/{header['source']}"
+            datatype = header["datatype"]
+            chunks = self.core._transformed(data[:SNIFF_BYTES], lambda: [data])
+            if (
+                self.core._datatype_for(source, header["job"], data[:SNIFF_BYTES])
+                is None
+                or not self.core.accepting(datatype)
+            ):
+                # Would fail the same way on every resend
+                self._dead_letter(site, header, record)
+            else:
+                try:
+                    delivered = self.core._deliver(
+                        source,
+                        header["job"],
+                        header["doc"],
+                        chunks,
+                        len(data),
+                        datatype,
+                        capture=False,
+                    )
+                except DestinationsHeld as e:
+                    self.core.log(f"{e}, holding relay from {site}")
+                    break
+                if not delivered:
+                    break
+            # Captured once per number, not again on every resend
+            self.core._capture(source, header["job"], header["doc"], chunks, datatype)
+            done = header["seq"]
+            self.state[site] = done
+            self._save_state()
+        return done
+
+    def _dead_letter(self, site: str, header: dict, record: bytes):
+        """Keep a job that cannot print here, in the outbox file format."""
+        self.core.metrics["relay_dead_letters"] += 1
+        path = self.dead_letter_dir / f"{_safe_filename(site)}-{header['seq']:012d}.job"
+        try:
+            self.dead_letter_dir.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(record)
+        except OSError as e:
+            self.core.log(f"Error writing dead letter {path}: {e}")
+        self.core.log(
+            f"Relay from {site}: job {header['job']} ({header['datatype']}) cannot "
+            f"print here, moved to {path}"
+        )
+
+    def _save_state(self):
+        temp_path = self.state_path.with_suffix(".tmp")
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_text(json.dumps(self.state))
+            os.replace(temp_path, self.state_path)
+        except OSError as e:
+            self.core.log(f"Error writing relay state: {e}")
+
+
+class IngestServer:
+    """Accepts jobs over raw TCP (9100) and LPD (515) and mirrors them.
+
+    Runs an asyncio loop in a background thread. Received data is charged to
+    the core's memory budget and handed through a bounded queue to `workers`
+    copy threads, so when the destination falls behind the queue fills up
+    and clients stop being read.
+    """
+
+    def __init__(
+        self,
+        core: PrinterMirrorCore,
+        host: str = "0.0.0.0",
+        raw_port: int = 9100,
+        lpd_port: int = 515,
+        queue_size: int = 16,
+        workers: int = 2,
+        idle_timeout: float = 5.0,
+        max_job_mb: float = 32,
+        raw_reserve_mb: float = 1,
+        budget_wait: float = 30.0,
+    ):
+        self.core = core
+        self.host = host
+        self.raw_port = raw_port
+        self.lpd_port = lpd_port
+        self.queue_size = queue_size
+        self.workers = max(1, workers)
+        self.idle_timeout = idle_timeout
+        # A job never holds more than the whole budget
+        self.max_job_size = min(
+            int(max_job_mb * 1024 * 1024), core.memory_budget.limit
+        )
+        self.raw_reserve = min(int(raw_reserve_mb * 1024 * 1024), self.max_job_size)
+        self.budget_wait = budget_wait
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+        self.ports: List[int] = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._job_ids = itertools.count(1)
+
+    def start(self):
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(ready,), name="ingest", daemon=True
+        )
+        self.thread.start()
+        ready.wait(10)
+
+    def stop(self, timeout: float = 5.0):
+        if self.loop is not None and self._stopping is not None:
+            self.loop.call_soon_threadsafe(self._stopping.set)
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self, ready: threading.Event):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self._serve(ready))
+        except Exception as e:
+            self.core.log(f"Ingest listener failed: {e}")
+        finally:
+            ready.set()
+            self.loop.close()
+
+    async def _serve(self, ready: threading.Event):
+        self._stopping = asyncio.Event()
+        self.queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix="ingest-copy")
+        servers = []
+        try:
+            for port, handler in (
+                (self.raw_port, self._handle_raw),
+                (self.lpd_port, self._handle_lpd),
+            ):
+                if not port:
+                    continue
+                server = await asyncio.start_server(handler, self.host, port)
+                servers.append(server)
+                self.ports.append(server.sockets[0].getsockname()[1])
+            for _ in range(self.workers):
+                asyncio.ensure_future(self._consume(executor))
+            self.core.log(
+                f"Ingest listening on {self.host} port(s) "
+                f"{', '.join(str(p) for p in self.ports)}"
+            )
+            ready.set()
+            await self._stopping.wait()
+        finally:
+            for server in servers:
+                server.close()
+            # Consumers and open connections; copies already handed to the
+            # executor are allowed to finish.
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown(wait=True)
+
+    async def _reserve(self, size: int):
+        """Reserve `size` bytes of the memory budget, waiting `budget_wait` at most.
+
+        Polls instead of blocking a thread, so waiting connections never tie
+        up an executor. Raises TimeoutError, which drops the connection.
+        """
+        budget = self.core.memory_budget
+        if budget.try_acquire(size):
+            return
+        budget.waits += 1
+        deadline = time.monotonic() + self.budget_wait
+        while not budget.try_acquire(size):
+            if time.monotonic() >= deadline:
+                self.core.metrics["ingest_budget_timeouts"] += 1
+                raise TimeoutError(
+                    f"no memory for {size} bytes within {self.budget_wait:.0f}s"
+                )
+            await asyncio.sleep(0.05)
+
+    async def _read(self, reader: asyncio.StreamReader, count: int = -1) -> bytes:
+        """Read `count` bytes (or until EOF / idle timeout) within the budget.
+
+        A declared count is reserved in full before reading. A job of unknown
+        length starts with `raw_reserve` bytes and doubles its reservation as
+        it grows. Either way a connection holds its memory while it waits for
+        more, so waits are bounded by `budget_wait`. The returned data stays
+        charged until the consumer releases it.
+        """
+        if count > self.max_job_size:
+            raise ValueError(f"job larger than {self.max_job_size} bytes")
+        reserved = count if count >= 0 else self.raw_reserve
+        await self._reserve(reserved)
+        chunks = []
+        total = 0
+        try:
+            while count < 0 or total < count:
+                want = 65536 if count < 0 else min(65536, count - total)
+                try:
+                    chunk = await asyncio.wait_for(
+                        reader.read(want), self.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    if count >= 0:
+                        raise
+                    break
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > self.max_job_size:
+                    raise ValueError(f"job larger than {self.max_job_size} bytes")
+                if total > reserved:
+                    grow = min(max(reserved, total - reserved), self.max_job_size - reserved)
+                    await self._reserve(grow)
+                    reserved += grow
+                chunks.append(chunk)
+        except BaseException:
+            self.core.memory_budget.release(reserved)
+            raise
+        if count >= 0 and total < count:
+            self.core.memory_budget.release(reserved)
+            raise asyncio.IncompleteReadError(b"", count)
+        self.core.memory_budget.release(reserved - total)
+        return b"".join(chunks)
+
+    async def _enqueue(self, source: str, document: str, data: bytes):
+        self.core.metrics["jobs_received"] += 1
+        await self.queue.put((source, next(self._job_ids), document, data))
+
+    async def _consume(self, executor: ThreadPoolExecutor):
+        loop = asyncio.get_running_loop()
+        while True:
+            source, job_id, document, data = await self.queue.get()
+            try:
+                self.core.log(f"New job: [{source}] [{job_id}] {document}")
+                await loop.run_in_executor(
+                    executor, self.core.submit_data, source, job_id, document, data
+                )
+            finally:
+                self.core.memory_budget.release(len(data))
+
+    async def _handle_raw(self, reader, writer):
+        peer = (writer.get_extra_info("peername") or ("?",))[0]
+        try:
+            # One job per connection; a pause longer than idle_timeout ends it
+            data = await self._read(reader)
+            if data:
+                await self._enqueue(f"raw:{peer}", f"Job from {peer}", data)
+        except Exception as e:
+            self.core.log(f"Ingest error from {peer}: {e}")
+        finally:
+            writer.close()
+
+    async def _handle_lpd(self, reader, writer):
+        peer = (writer.get_extra_info("peername") or ("?",))[0]
+        try:
+            line = await reader.readline()
+            if not line:
+                return
+            command, queue = line[0], line[1:].strip().decode("ascii", "replace")
+            if command == 0x02:
+                # Receive a printer job (RFC 1179 section 5.2)
+                writer.write(b"\x00")
+                await writer.drain()
+                await self._lpd_receive_job(reader, writer, queue, peer)
+            elif command in (0x03, 0x04):
+                # Queue state: we never hold jobs
+                writer.write(b"no entries\n")
+                await writer.drain()
+        except Exception as e:
+            self.core.log(f"LPD error from {peer}: {e}")
+        finally:
+            writer.close()
+
+    async def _lpd_receive_job(self, reader, writer, queue: str, peer: str):
+        control: Dict[str, str] = {}
+        data_files: List[bytes] = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                subcommand = line[0]
+                if subcommand == 0x01:
+                    # Abort job
+                    for data in data_files:
+                        self.core.memory_budget.release(len(data))
+                    data_files = []
+                    writer.write(b"\x00")
+                    await writer.drain()
+                    continue
+                if subcommand not in (0x02, 0x03):
+                    writer.write(b"\x01")
+                    await writer.drain()
+                    break
 
+                count = int(line[1:].split(b" ", 1)[0])
+                writer.write(b"\x00")
+                await writer.drain()
+                if count == 0 and subcommand == 0x03:
+                    content = await self._read(reader)
+                else:
+                    content = await self._read(reader, count)
+                    await reader.readexactly(1)
+                writer.write(b"\x00")
+                await writer.drain()
 
-def get_config() -> dict:
-    """Read configuration from file."""
-    if CONFIG_PATH.exists():
+                if subcommand == 0x02:
+                    self.core.memory_budget.release(len(content))
+                    for entry in content.decode("latin-1").splitlines():
+                        if entry:
+                            control.setdefault(entry[0], entry[1:])
+                else:
+                    data_files.append(content)
+        except BaseException:
+            for data in data_files:
+                self.core.memory_budget.release(len(data))
+            raise
+
+        document = control.get("J") or control.get("N") or f"Job from {peer}"
+        for data in data_files:
+            await self._enqueue(f"lpd:{queue}", document, data)
+
+
+class HashRing:
+    """Consistent hash ring: adding a shard moves only ~1/N of the keys."""
+
+    def __init__(self, nodes: List[str], vnodes: int = 64):
+        self._ring: List[Tuple[int, str]] = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes)
+        )
+        self._keys = [h for h, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+def partition_sources(sources: List[str], shards: int) -> List[List[str]]:
+    """Split source printers across `shards` workers by consistent hashing."""
+    ring = HashRing([f"shard-{i}" for i in range(shards)])
+    parts: List[List[str]] = [[] for _ in range(shards)]
+    for printer in sources:
+        parts[int(ring.node_for(printer).split("-")[1])].append(printer)
+    return parts
+
+
+class _ShardLogAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[shard {self.extra['shard']}] {msg}", kwargs
+
+
+def _shard_worker(shard: int, config: dict, log_queue, metrics_queue, stop_event):
+    """Worker process entry point: mirror one shard of the source printers."""
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+    logger = _ShardLogAdapter(logging.getLogger(__name__), {"shard": shard})
+
+    mirror = PrinterMirrorCore.from_config(config, logger=logger)
+    mirror.status_path = STATUS_PATH.with_name(f"status-shard{shard}.json")
+    mirror.running = True
+    logger.info(f"Worker started: [{', '.join(mirror.source_printers)}]")
+    if not mirror.prepare():
+        return
+    last_report = 0.0
+    try:
+        while not stop_event.is_set():
+            mirror.run_once()
+            if time.monotonic() - last_report >= 5.0:
+                metrics_queue.put((shard, dict(mirror.metrics)))
+                last_report = time.monotonic()
+            stop_event.wait(mirror.poll_delay())
+    except KeyboardInterrupt:
+        # Console Ctrl+C reaches every process; the supervisor handles it
+        pass
+    mirror.running = False
+    mirror.close()
+    metrics_queue.put((shard, dict(mirror.metrics)))
+
+
+class ShardSupervisor:
+    """Runs source printers split across worker processes.
+
+    Workers log through a shared queue into this process's handlers and
+    report their counters every few seconds; crashed workers are restarted
+    with a growing delay.
+    """
+
+    def __init__(self, config: dict, workers: int, logger=None):
+        self.config = config
+        self.workers = max(1, workers)
+        self.logger = logger or logging.getLogger(__name__)
+        self.shards = partition_sources(config["source_printers"], self.workers)
+        self.processes: Dict[int, multiprocessing.Process] = {}
+        self.restarts: Counter = Counter()
+        self.started: Dict[int, float] = {}
+        self.shard_metrics: Dict[int, dict] = {}
+        self._stop = threading.Event()
+
+    @property
+    def metrics(self) -> Counter:
+        """Counters summed over all workers."""
+        total: Counter = Counter()
+        for counters in self.shard_metrics.values():
+            total.update(counters)
+        return total
+
+    def _spawn(self, shard: int):
+        config = dict(
+            self.config,
+            source_printers=self.shards[shard],
+            ingest={"enabled": False},
+            relay_receiver={"enabled": False},
+            ha=scoped_ha(self.config, f"shard{shard}"),
+            destinations=scoped_destinations(
+                self.config["destinations"], f"shard{shard}"
+            ),
+        )
+        process = multiprocessing.Process(
+            target=_shard_worker,
+            args=(shard, config, self.log_queue, self.metrics_queue, self.stop_event),
+            name=f"mirror-shard-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[shard] = process
+        self.started[shard] = time.monotonic()
+
+    def run(self):
+        self.log_queue = multiprocessing.Queue()
+        self.metrics_queue = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        listener = logging.handlers.QueueListener(
+            self.log_queue, *logging.getLogger().handlers, respect_handler_level=True
+        )
+        listener.start()
+        if self.config.get("ingest", {}).get("enabled"):
+            self.logger.warning("Network ingest is not available with workers > 1")
+        if self.config.get("relay_receiver", {}).get("enabled"):
+            self.logger.warning("The relay receiver is not available with workers > 1")
+
+        for shard, printers in enumerate(self.shards):
+            self.logger.info(f"Shard {shard}: {', '.join(printers) or '(none)'}")
+            if printers:
+                self._spawn(shard)
+
+        next_restart: Dict[int, float] = {}
+        last_summary = time.monotonic()
         try:
-            with open(CONFIG_PATH, "r") as f:
-                config = json.load(f)
-                # Handle legacy single source_printer config
-                if "source_printer" in config and "source_printers" not in config:
-                    config["source_printers"] = [config["source_printer"]]
-                return {**DEFAULT_CONFIG, **config}
-        except:
-            pass
-    return DEFAULT_CONFIG
+            while not self._stop.wait(1.0):
+                self._drain_metrics()
+                for shard, process in list(self.processes.items()):
+                    if process.is_alive():
+                        continue
+                    if shard not in next_restart:
+                        if time.monotonic() - self.started[shard] > 300.0:
+                            # Ran fine for a while: restart without backoff
+                            self.restarts[shard] = 0
+                        delay = min(60.0, 2.0 ** self.restarts[shard])
+                        self.logger.error(
+                            f"Shard {shard} exited (code {process.exitcode}), "
+                            f"restarting in {delay:.0f}s"
+                        )
+                        next_restart[shard] = time.monotonic() + delay
+                    elif time.monotonic() >= next_restart[shard]:
+                        del next_restart[shard]
+                        self.restarts[shard] += 1
+                        self._spawn(shard)
+                if time.monotonic() - last_summary >= 60.0:
+                    last_summary = time.monotonic()
+                    self.logger.info(f"Workers: {dict(self.metrics)}")
+        finally:
+            self.stop_event.set()
+            for process in self.processes.values():
+                process.join(self.config["stop_timeout"])
+                if process.is_alive():
+                    process.terminate()
+            self._drain_metrics()
+            listener.stop()
+            self.logger.info(f"Supervisor stopped: {dict(self.metrics)}")
 
+    def _drain_metrics(self):
+        while True:
+            try:
+                shard, counters = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            self.shard_metrics[shard] = counters
 
-def save_config(config: dict):
-    """Save configuration to file."""
-    CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2)
+    def stop(self):
+        self._stop.set()
 
 
-try:
-    import win32serviceutil
-    import win32service
-    import win32event
-    import servicemanager
-    import win32print
+class FairShareQueue:
+    """Job queues of several pipelines, served in weighted fair-share order.
 
-    SERVICE_AVAILABLE = True
-except ImportError:
-    SERVICE_AVAILABLE = False
+    Each pipeline has a virtual clock that advances by 1/weight for every
+    job taken from it, and pop() serves the pipeline with the lowest clock.
+    A pipeline whose queue was empty restarts from the clock of the last
+    served job, so it cannot save up credit while idle.
+    """
 
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = {name: max(0.01, float(w)) for name, w in weights.items()}
+        self.queues: Dict[str, deque] = {name: deque() for name in weights}
+        self.clocks: Dict[str, float] = {name: 0.0 for name in weights}
+        self.vtime = 0.0
+
+    def push(self, name: str, item):
+        jobs = self.queues[name]
+        if not jobs:
+            self.clocks[name] = max(self.clocks[name], self.vtime)
+        jobs.append(item)
+
+    def pop(self, eligible: Optional[Callable[[str], bool]] = None):
+        """Return (name, item) for the next job, or None if nothing is eligible."""
+        best = None
+        for name, jobs in self.queues.items():
+            if not jobs or (best is not None and self.clocks[name] >= self.clocks[best]):
+                continue
+            if eligible is None or eligible(name):
+                best = name
+        if best is None:
+            return None
+        self.vtime = self.clocks[best]
+        self.clocks[best] += 1.0 / self.weights[best]
+        return best, self.queues[best].popleft()
+
+    def backlog(self, name: str) -> int:
+        return len(self.queues[name])
+
+    def __len__(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+
+class _PipelineLogAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return f"[{self.extra['pipeline']}] {msg}", kwargs
 
-class PrinterMirrorCore:
-    """Core mirror service with multi-source support."""
+
+class PipelineEngine:
+    """Runs several named mirror pipelines in one process.
+
+    Each pipeline is a PrinterMirrorCore with its own sources, destinations
+    and settings, polled on its own schedule. The copies of all pipelines
+    share one pool of `workers` threads and are handed out in weighted
+    fair-share order, so a busy pipeline cannot starve the others.
+    """
 
     def __init__(
         self,
-        source_printers: List[str],
-        dest_printer: str,
-        interval: float = 1.0,
+        cores: Dict[str, PrinterMirrorCore],
+        weights: Optional[Dict[str, float]] = None,
+        workers: int = 4,
+        stop_timeout: float = 5.0,
         logger=None,
     ):
-        self.source_printers = source_printers
-        self.dest_printer = dest_printer
-        self.interval = interval
+        self.cores = cores
+        self.workers = max(1, workers)
+        self.stop_timeout = stop_timeout
         self.logger = logger or logging.getLogger(__name__)
+        self.queue = FairShareQueue(
+            {name: (weights or {}).get(name, 1.0) for name in cores}
+        )
+        self.profiler: Optional[MirrorProfiler] = None
         self.running = False
-        self.processed_jobs: Dict[str, Set[int]] = {p: set() for p in source_printers}
-        self.spool_dir = os.path.join(
-            os.environ.get("SystemRoot", "C:\\Windows"), "System32", "spool", "PRINTERS"
+        self._wake = threading.Event()
+        self._in_flight: Set = set()
+        # (pipeline, printer, job id) of jobs no destination could take yet
+        self._held: deque = deque()
+
+    @classmethod
+    def from_config(cls, config: dict, logger=None) -> "PipelineEngine":
+        """Build one core per entry of config["pipelines"]."""
+        logger = logger or logging.getLogger(__name__)
+        # One budget for the whole process, whichever pipeline the copy is for
+        budget = MemoryBudget(config["memory_budget_mb"] * 1024 * 1024)
+        cores = {}
+        weights = {}
+        for name, spec in config["pipelines"].items():
+            spec = dict(spec)
+            weights[name] = spec.pop("weight", 1.0)
+            # Listeners are per pipeline; the top-level ones would all bind
+            # the same ports
+            pipeline_config = {
+                **config,
+                "ingest": {"enabled": False},
+                "relay_receiver": {"enabled": False},
+                "ha": scoped_ha(config, _safe_filename(name)),
+                **spec,
+            }
+            pipeline_config["destinations"] = scoped_destinations(
+                pipeline_config["destinations"], _safe_filename(name)
+            )
+            core = PrinterMirrorCore.from_config(
+                pipeline_config,
+                logger=_PipelineLogAdapter(logger, {"pipeline": name}),
+                memory_budget=budget,
+            )
+            core.status_path = STATUS_PATH.with_name(
+                f"status-{_safe_filename(name)}.json"
+            )
+            cores[name] = core
+        return cls(
+            cores,
+            weights,
+            workers=config["pipeline_workers"],
+            stop_timeout=config["stop_timeout"],
+            logger=logger,
         )
 
-    def log(self, message: str):
-        self.logger.info(message)
+    def _eligible(self, name: str) -> bool:
+        backpressure = self.cores[name].backpressure
+        return backpressure is None or not backpressure.saturated()
 
-    def _find_spool_file(self, job_id: int) -> Optional[str]:
-        """Find the SPL file for a specific job."""
-        try:
-            patterns = [f"FP{job_id:05d}.SPL", f"{job_id:05d}.SPL"]
-            for pattern in patterns:
-                filepath = os.path.join(self.spool_dir, pattern)
-                if os.path.exists(filepath):
-                    return filepath
+    def _dispatch(self, pool: ThreadPoolExecutor):
+        """Hand queued jobs to free workers in fair-share order."""
+        while len(self._in_flight) < self.workers:
+            entry = self.queue.pop(self._eligible)
+            if entry is None:
+                return
+            name, (printer, job_id, job_info) = entry
+            future = pool.submit(self._process, name, printer, job_id, job_info)
+            self._in_flight.add(future)
+            future.add_done_callback(self._finished)
 
-            spl_files = []
-            for f in os.listdir(self.spool_dir):
-                if f.upper().endswith(".SPL"):
-                    full_path = os.path.join(self.spool_dir, f)
-                    try:
-                        mtime = os.path.getmtime(full_path)
-                        size = os.path.getsize(full_path)
-                        if size > 0:
-                            spl_files.append((full_path, mtime))
-                    except OSError:
-                        continue
+    def _process(self, name: str, printer: str, job_id: int, job_info: dict):
+        try:
+            self.cores[name].process_job(printer, job_id, job_info)
+        except DestinationsHeld as e:
+            self.cores[name].log(f"{e}, holding it")
+            self._held.append((name, printer, job_id))
 
-            if spl_files:
-                spl_files.sort(key=lambda x: x[1], reverse=True)
-                return spl_files[0][0]
-        except Exception as e:
-            self.log(f"Error finding spool file: {e}")
-        return None
+    def _finished(self, future):
+        self._in_flight.discard(future)
+        self._wake.set()
 
-    def _read_spool_data(self, job_id: int, retries: int = 5) -> Optional[bytes]:
-        """Read spool data with retries."""
-        for attempt in range(retries):
-            spool_file = self._find_spool_file(job_id)
-            if spool_file:
-                try:
-                    time.sleep(0.3)
-                    with open(spool_file, "rb") as f:
-                        data = f.read()
-                    if data and len(data) > 0:
-                        return data
-                except Exception:
-                    pass
-            if attempt < retries - 1:
-                time.sleep(0.5)
-        return None
+    def run(self):
+        self.running = True
+        if self.profiler is not None:
+            self.profiler.start()
+        for name, core in self.cores.items():
+            core.running = True
+            sources_str = ", ".join(core.source_printers)
+            core.log(f"Pipeline started: [{sources_str}] -> {core.dest_printer}")
+            if not core.prepare():
+                self.running = False
 
-    def _copy_job(self, source_printer: str, job_id: int, document_name: str) -> bool:
-        """Copy a job to the destination printer."""
+        pool = ThreadPoolExecutor(self.workers, thread_name_prefix="pipeline")
         try:
-            spool_data = self._read_spool_data(job_id)
-            if not spool_data:
-                self.log(f"Could not read job {job_id}")
-                return False
+            while self.running:
+                self._wake.clear()
+                started = time.monotonic()
+                polled = [
+                    core
+                    for core in self.cores.values()
+                    if any(s.due(started) for s in core.schedules.values())
+                ]
+                while self._held:
+                    # Unmarked here, on the thread that diffs the trackers
+                    name, printer, job_id = self._held.popleft()
+                    self.cores[name].processed_jobs[printer].unmark(job_id)
+                for name, core in self.cores.items():
+                    for printer, job_id, job_info in core._schedule(
+                        core._collect_new_jobs()
+                    ):
+                        # Marked when queued so the next poll does not queue it again
+                        core.processed_jobs[printer].mark(job_id, job_info)
+                        self.queue.push(name, (printer, job_id, job_info))
+                    core.metrics["backlog"] = self.queue.backlog(name)
+                    core.write_status()
+                self._dispatch(pool)
+                for core in polled:
+                    if core.watchdog is not None:
+                        core.watchdog.scan_finished(time.monotonic() - started)
+                if self.profiler is not None:
+                    self.profiler.tick()
+                delay = min(core.poll_delay() for core in self.cores.values())
+                self._wake.wait(delay)
+        finally:
+            self.running = False
+            for core in self.cores.values():
+                core.running = False
+            if self._in_flight:
+                self.logger.info(
+                    f"Waiting for {len(self._in_flight)} copy(ies) to finish"
+                )
+                wait(list(self._in_flight), timeout=self.stop_timeout)
+            pool.shutdown(wait=False)
+            if self.profiler is not None:
+                self.profiler.stop()
+            for core in self.cores.values():
+                core.close()
+            self.logger.info("Pipelines stopped")
 
-            handle = win32print.OpenPrinter(self.dest_printer)
-            try:
-                doc_info = (f"[MIRROR:{source_printer}] {document_name}", "", "RAW")
-                new_job_id = win32print.StartDocPrinter(handle, 1, doc_info)
-                try:
-                    win32print.StartPagePrinter(handle)
-                    win32print.WritePrinter(handle, spool_data)
-                    win32print.EndPagePrinter(handle)
-                finally:
-                    win32print.EndDocPrinter(handle)
+    def stop(self):
+        self.running = False
+        for core in self.cores.values():
+            core.running = False
+        self._wake.set()
 
-                self.log(
-                    f"OK: [{source_printer}] Job {job_id} -> {self.dest_printer} (new: {new_job_id}, {len(spool_data)} bytes)"
-                )
-                return True
-            finally:
-                win32print.ClosePrinter(handle)
-        except Exception as e:
-            self.log(f"Error copying job {job_id}: {e}")
-            return False
 
-    def _get_current_jobs(self, printer_name: str) -> dict:
-        """Get current jobs from a printer."""
-        jobs = {}
-        try:
-            handle = win32print.OpenPrinter(printer_name)
+# Config keys whose values are left out of traces, which leave the site
+TRACE_SECRET_KEYS = ("token",)
+
+
+def _redacted(value):
+    """A copy of a config value with every secret blanked out."""
+    if isinstance(value, dict):
+        return {
+            key: "<redacted>" if key in TRACE_SECRET_KEYS and item else _redacted(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_redacted(item) for item in value]
+    return value
+
+
+# Order of the job fields stored per job in a trace
+TRACE_JOB_FIELDS = (
+    "document",
+    "status",
+    "size",
+    "submitted",
+    "owner",
+    "machine",
+    "datatype",
+    "pages",
+)
+
+
+class TraceRecorder:
+    """Records what a mirror sees into a compact trace for offline replay.
+
+    The trace is gzip-compressed JSON lines: a header with the config
+    (relay tokens blanked out), then an event each time a source's job list
+    changes, each time a spool file is read (its size and first
+    `spool_bytes` bytes) and each time a job is delivered. Times are
+    seconds since recording started.
+    """
+
+    def __init__(self, path: str, config: dict, spool_bytes: int = 4096):
+        import gzip
+
+        self.path = path
+        self.spool_bytes = spool_bytes
+        self.started = time.monotonic()
+        self._file = gzip.open(path, "wt", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._last: Dict[str, dict] = {}
+        self._write(
+            {
+                "e": "header",
+                "version": 1,
+                "time": time.time(),
+                "config": _redacted(config),
+            }
+        )
+
+    def _write(self, event: dict):
+        event.setdefault("t", round(time.monotonic() - self.started, 3))
+        line = json.dumps(event, separators=(",", ":"))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def snapshot(self, printer: str, jobs: dict):
+        """Record a source's job list if it differs from the last one."""
+        if self._last.get(printer) == jobs:
+            return
+        self._last[printer] = jobs
+        self._write(
+            {
+                "e": "jobs",
+                "p": printer,
+                "jobs": {
+                    str(job_id): [info.get(f, "") for f in TRACE_JOB_FIELDS]
+                    for job_id, info in jobs.items()
+                },
+            }
+        )
+
+    def spool(self, job_id: int, spool_file: str, size: int):
+        import base64
+
+        data = b""
+        if self.spool_bytes:
             try:
-                job_list = win32print.EnumJobs(handle, 0, -1, 1)
-                for job in job_list:
-                    job_id = job.get("JobId", 0)
-                    jobs[job_id] = {
-                        "document": job.get("pDocument", "Unknown"),
-                        "status": job.get("Status", 0),
-                    }
-            finally:
-                win32print.ClosePrinter(handle)
-        except Exception:
-            pass
-        return jobs
+                with open(spool_file, "rb") as f:
+                    data = f.read(self.spool_bytes)
+            except OSError:
+                pass
+        self._write(
+            {
+                "e": "spool",
+                "j": job_id,
+                "size": size,
+                "data": base64.b64encode(data).decode("ascii"),
+            }
+        )
 
-    def run_once(self) -> int:
-        """Execute one iteration of the mirror. Returns number of jobs copied."""
-        copied = 0
+    def delivered(self, printer: str, job_id: int, dest: str):
+        self._write({"e": "delivered", "p": printer, "j": job_id, "d": dest})
 
-        for printer in self.source_printers:
-            if not self.running:
-                break
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
 
-            current_jobs = self._get_current_jobs(printer)
-            new_job_ids = set(current_jobs.keys()) - self.processed_jobs.get(
-                printer, set()
-            )
 
-            for job_id in sorted(new_job_ids):
-                if not self.running:
-                    break
+class _ReplaySink:
+    """Destination used during replay: reads the data and notes the time."""
 
-                job_info = current_jobs[job_id]
-                document = job_info["document"]
+    def __init__(self, name: str, replayer: "TraceReplayer"):
+        self.name = name
+        self.replayer = replayer
 
-                if document.startswith("[MIRROR"):
-                    self.processed_jobs[printer].add(job_id)
-                    continue
+    def accepts(self, datatype: str) -> bool:
+        return True
 
-                self.log(f"New job: [{printer}] [{job_id}] {document}")
-                time.sleep(1.0)
+    def queue_depth(self) -> Optional[int]:
+        return None
 
-                if self._copy_job(printer, job_id, document):
-                    copied += 1
-                self.processed_jobs[printer].add(job_id)
+    def send(
+        self,
+        doc_name: str,
+        chunks: Iterable[bytes],
+        datatype: str = "RAW",
+        source: str = "",
+        job_id: int = 0,
+    ) -> str:
+        size = sum(len(chunk) for chunk in chunks)
+        self.replayer.completed(source, job_id, size)
+        return "replay"
 
-            self.processed_jobs[printer] &= set(current_jobs.keys())
+    def close(self):
+        pass
 
-        return copied
 
-    def run(self):
-        """Run the main mirror loop."""
-        self.running = True
-        sources_str = ", ".join(self.source_printers)
-        self.log(f"Mirror started: [{sources_str}] -> {self.dest_printer}")
+class TraceReplayer:
+    """Feeds a recorded trace through a PrinterMirrorCore offline.
 
-        try:
-            os.listdir(self.spool_dir)
-        except PermissionError:
-            self.log(
-                "ERROR: No access to spool directory. Run as Administrator/SYSTEM."
-            )
+    Source queues answer with the recorded job lists once the replay clock
+    reaches them. Spool files are recreated in a temporary directory from
+    the recorded bytes, zero-padded to their recorded size, and every
+    destination is replaced by a sink that only counts. With `speed` > 1
+    the clock, polling intervals and settle delay all run faster. Needs no
+    spooler, so it also runs on Linux.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, pad: bool = True):
+        import base64
+        import gzip
+
+        self.speed = max(0.01, speed)
+        self.pad = pad
+        self.config: dict = {}
+        # printer -> [(t, {job_id: info})] in recording order
+        self.snapshots: Dict[str, List[Tuple[float, dict]]] = {}
+        self.spools: Dict[int, Tuple[int, bytes]] = {}
+        # (printer, job_id) -> time the original mirror delivered it
+        self.recorded: Dict[Tuple[str, int], float] = {}
+        self.end = 0.0
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                event = json.loads(line)
+                self.end = max(self.end, event["t"])
+                kind = event["e"]
+                if kind == "header":
+                    self.config = event["config"]
+                elif kind == "jobs":
+                    jobs = {
+                        int(job_id): dict(zip(TRACE_JOB_FIELDS, fields))
+                        for job_id, fields in event["jobs"].items()
+                    }
+                    self.snapshots.setdefault(event["p"], []).append((event["t"], jobs))
+                elif kind == "spool":
+                    data = base64.b64decode(event["data"])
+                    self.spools[event["j"]] = (event["size"], data)
+                elif kind == "delivered":
+                    self.recorded.setdefault((event["p"], event["j"]), event["t"])
+
+        self.core: Optional[PrinterMirrorCore] = None
+        self.done: Dict[Tuple[str, int], Tuple[float, int]] = {}
+        self._written: Set[int] = set()
+        self._lock = threading.Lock()
+        self.t0 = 0.0
+
+    def clock(self) -> float:
+        """Replay time, in seconds of the original recording."""
+        return (time.monotonic() - self.t0) * self.speed
+
+    def first_seen(self, printer: str, job_id: int) -> Optional[float]:
+        for t, snapshot in self.snapshots.get(printer, []):
+            if job_id in snapshot:
+                return t
+        return None
+
+    def _jobs_at(self, printer: str) -> dict:
+        """Stands in for EnumJobs: the job list recorded at the replay time."""
+        now = self.clock()
+        jobs: dict = {}
+        for t, snapshot in self.snapshots.get(printer, []):
+            if t > now:
+                break
+            jobs = snapshot
+        for job_id in jobs:
+            if job_id not in self._written:
+                self._write_spool(job_id)
+        return jobs
+
+    def _write_spool(self, job_id: int):
+        self._written.add(job_id)
+        if job_id not in self.spools:
             return
+        size, data = self.spools[job_id]
+        path = os.path.join(self.core.spool_dir, f"FP{job_id:05d}.SPL")
+        with open(path, "wb") as f:
+            f.write(data)
+            if self.pad and size > len(data):
+                f.truncate(size)
 
-        # Initialize processed jobs for all source printers
-        for printer in self.source_printers:
-            existing_jobs = self._get_current_jobs(printer)
-            self.processed_jobs[printer] = set(existing_jobs.keys())
-            self.log(f"[{printer}] Ignoring {len(existing_jobs)} existing job(s)")
+    def _job_status(self, printer: str, job_id: int) -> Optional[int]:
+        info = self.core.last_jobs.get(printer, {}).get(job_id)
+        return info["status"] if info else None
 
-        while self.running:
-            self.run_once()
-            time.sleep(self.interval)
+    def completed(self, printer: str, job_id: int, size: int):
+        with self._lock:
+            self.done.setdefault((printer, job_id), (self.clock(), size))
 
-        self.log("Mirror stopped")
+    def build_core(self, spool_dir: str) -> PrinterMirrorCore:
+        """A mirror core using the recorded config, scaled to `speed`."""
+        speed = self.speed
+        config = {
+            **DEFAULT_CONFIG,
+            **self.config,
+            "interval": self.config.get("interval", 1.0) / speed,
+            "max_interval": self.config.get("max_interval", 0) / speed,
+            "tail_poll": self.config.get("tail_poll", 0.2) / speed,
+            "source_overrides": {
+                printer: {
+                    k: v / speed if k in ("interval", "max_interval") else v
+                    for k, v in override.items()
+                }
+                for printer, override in self.config.get(
+                    "source_overrides", {}
+                ).items()
+            },
+            "ingest": {"enabled": False},
+            "relay_receiver": {"enabled": False},
+            "retention": {"enabled": False},
+            "backpressure": {"enabled": False},
+            "slo": {"enabled": False},
+            "ha": {"enabled": False},
+            # Same names, but nothing that connects anywhere or writes files
+            # while the core is built; every sink is replaced below
+            "destinations": {
+                name: {"type": "printer"}
+                for name in self.config.get("destinations", {})
+            },
+        }
+        core = PrinterMirrorCore.from_config(config)
+        core.spool_dir = spool_dir
+        core.settle_delay /= speed
+        core.spool_read_delay /= speed
+        core.spool_retry_delay /= speed
+        for sink in core.sinks.values():
+            sink.close()
+        core.sinks = {name: _ReplaySink(name, self) for name in core.sinks}
+        core._get_current_jobs = self._jobs_at
+        core._job_status = self._job_status
+        return core
 
-    def stop(self):
-        """Stop the mirror service."""
-        self.running = False
+    def run(self, drain: float = 30.0) -> dict:
+        """Replay the trace, allowing `drain` more seconds for the last copies."""
+        import shutil
+        import tempfile
+
+        spool_dir = tempfile.mkdtemp(prefix="mirror-replay-")
+        try:
+            self.core = self.build_core(spool_dir)
+            self.core.running = True
+            self.t0 = time.monotonic()
+            if self.core.prepare():
+                while self.clock() < self.end + drain:
+                    self.core.run_once()
+                    if self.clock() > self.end and len(self.done) >= len(self.recorded):
+                        break
+                    time.sleep(self.core.poll_delay())
+            self.core.running = False
+            self.core.close()
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        return self.report()
+
+    def report(self) -> dict:
+        """Throughput and detection-to-delivery latency, replayed vs recorded."""
+
+        def percentiles(values: List[float]) -> dict:
+            if not values:
+                return {}
+            values = sorted(values)
+            return {
+                "p50": round(values[len(values) // 2], 3),
+                "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                "max": round(values[-1], 3),
+            }
+
+        def latencies(finished: Dict[Tuple[str, int], float]) -> List[float]:
+            result = []
+            for (printer, job_id), t in finished.items():
+                seen = self.first_seen(printer, job_id)
+                if seen is not None:
+                    result.append(t - seen)
+            return result
+
+        duration = max(self.end, 0.001)
+        total_bytes = sum(size for _, size in self.done.values())
+        return {
+            "speed": self.speed,
+            "duration": round(duration, 1),
+            "jobs": len(self.done),
+            "jobs_recorded": len(self.recorded),
+            "jobs_per_min": round(len(self.done) * 60 / duration, 1),
+            "bytes_per_sec": round(total_bytes / duration),
+            "latency": percentiles(latencies({k: t for k, (t, _) in self.done.items()})),
+            "recorded_latency": percentiles(latencies(self.recorded)),
+        }
 
 
 if SERVICE_AVAILABLE:
@@ -264,6 +4379,7 @@ if SERVICE_AVAILABLE:
             win32serviceutil.ServiceFramework.__init__(self, args)
             self.stop_event = win32event.CreateEvent(None, 0, 0, None)
             self.mirror = None
+            self.engine = None
 
             # Configure logging
             LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -278,7 +4394,9 @@ if SERVICE_AVAILABLE:
         def SvcStop(self):
             self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
             win32event.SetEvent(self.stop_event)
-            if self.mirror:
+            if self.engine:
+                self.engine.stop()
+            elif self.mirror:
                 self.mirror.stop()
 
         def SvcDoRun(self):
@@ -292,12 +4410,47 @@ if SERVICE_AVAILABLE:
         def main(self):
             config = get_config()
 
-            self.mirror = PrinterMirrorCore(
-                source_printers=config["source_printers"],
-                dest_printer=config["dest_printer"],
-                interval=config["interval"],
-                logger=self.logger,
-            )
+            if config["pipelines"]:
+                self.engine = PipelineEngine.from_config(config, logger=self.logger)
+                if config["profile"]:
+                    self.engine.profiler = MirrorProfiler(
+                        interval=config["profile_interval"]
+                    )
+                self.engine.run()
+                self.logger.info("Service stopped")
+                return
+
+            if config["workers"] > 1:
+                if config["profile"]:
+                    self.logger.warning(
+                        "Profiling does not cover worker processes (workers > 1); "
+                        "set workers to 1 to profile"
+                    )
+                self.engine = ShardSupervisor(
+                    config, config["workers"], logger=self.logger
+                )
+                self.engine.run()
+                self.logger.info("Service stopped")
+                return
+
+            # Built only here: a core starts destination threads (relay)
+            self.mirror = PrinterMirrorCore.from_config(config, logger=self.logger)
+            self.mirror.status_path = STATUS_PATH
+            if config["profile"]:
+                self.mirror.profiler = MirrorProfiler(
+                    interval=config["profile_interval"]
+                )
+                self.logger.info(f"Profiling enabled, dumps in {PROFILE_DIR}")
+
+            if config["engine"] == "async":
+                self.engine = AsyncMirrorEngine(
+                    self.mirror,
+                    workers=config["async_workers"],
+                    stop_timeout=config["stop_timeout"],
+                )
+                self.engine.run()
+                self.logger.info("Service stopped")
+                return
 
             self.mirror.running = True
             sources_str = ", ".join(config["source_printers"])
@@ -305,26 +4458,23 @@ if SERVICE_AVAILABLE:
                 f"Service started: [{sources_str}] -> {config['dest_printer']}"
             )
 
-            try:
-                os.listdir(self.mirror.spool_dir)
-            except PermissionError:
-                self.logger.error("No access to spool directory")
+            if self.mirror.profiler is not None:
+                self.mirror.profiler.start()
+            if not self.mirror.prepare():
                 return
 
-            # Initialize
-            for printer in self.mirror.source_printers:
-                existing = self.mirror._get_current_jobs(printer)
-                self.mirror.processed_jobs[printer] = set(existing.keys())
-
             # Main loop
             while self.mirror.running:
                 rc = win32event.WaitForSingleObject(
-                    self.stop_event, int(config["interval"] * 1000)
+                    self.stop_event, int(self.mirror.poll_delay() * 1000)
                 )
                 if rc == win32event.WAIT_OBJECT_0:
                     break
                 self.mirror.run_once()
 
+            if self.mirror.profiler is not None:
+                self.mirror.profiler.stop()
+            self.mirror.close()
             self.logger.info("Service stopped")
 
 
@@ -370,9 +4520,15 @@ def uninstall_service():
         return False
 
 
-def run_console():
-    """Run in console mode (not as service)."""
+def run_console(
+    profile: bool = False, trace: Optional[str] = None, spool_bytes: int = 4096
+):
+    """Run in console mode (not as service), optionally recording a trace."""
     config = get_config()
+    profile = profile or config["profile"]
+    if trace and (config["pipelines"] or config["workers"] > 1):
+        print("Recording runs a single mirror: pipelines and workers are ignored")
+        config = {**config, "pipelines": {}, "workers": 1}
 
     logging.basicConfig(
         level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -386,25 +4542,80 @@ def run_console():
     
     Source(s):   {sources_str}
     Destination: {config["dest_printer"]}
+    Fallback(s): {", ".join(config["fallback_printers"]) or "-"}
+    Pipelines:   {", ".join(config["pipelines"]) or "-"}
+    Profiling:   {PROFILE_DIR if profile else "off"}
     
     Press Ctrl+C to stop
     """)
 
-    mirror = PrinterMirrorCore(
-        source_printers=config["source_printers"],
-        dest_printer=config["dest_printer"],
-        interval=config["interval"],
-    )
+    if config["pipelines"]:
+        engine = PipelineEngine.from_config(config)
+        if profile:
+            engine.profiler = MirrorProfiler(interval=config["profile_interval"])
+        try:
+            engine.run()
+        except KeyboardInterrupt:
+            engine.stop()
+            print("\nStopped by user")
+        return
+
+    if config["workers"] > 1:
+        if profile:
+            print("Profiling does not cover worker processes; set workers to 1")
+        try:
+            ShardSupervisor(config, config["workers"]).run()
+        except KeyboardInterrupt:
+            print("\nStopped by user")
+        return
+
+    mirror = PrinterMirrorCore.from_config(config)
+    mirror.status_path = STATUS_PATH
+    if profile:
+        mirror.profiler = MirrorProfiler(interval=config["profile_interval"])
+    if trace:
+        mirror.recorder = TraceRecorder(trace, config, spool_bytes)
+        print(f"Recording to {trace}")
 
     try:
-        mirror.run()
+        if config["engine"] == "async":
+            AsyncMirrorEngine(
+                mirror,
+                workers=config["async_workers"],
+                stop_timeout=config["stop_timeout"],
+            ).run()
+        else:
+            mirror.run()
     except KeyboardInterrupt:
         mirror.stop()
+        if mirror.profiler is not None:
+            mirror.profiler.stop()
         print("\nStopped by user")
+    finally:
+        if mirror.recorder is not None:
+            mirror.recorder.close()
+
+
+def run_replay(trace: str, speed: float = 1.0):
+    """Replay a recorded trace offline and print latency and throughput."""
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+    replayer = TraceReplayer(trace, speed)
+    print(f"Replaying {trace}: {replayer.end:.0f}s of traffic at {speed:g}x")
+    report = replayer.run()
+    print(f"""
+    Jobs:        {report["jobs"]} mirrored ({report["jobs_recorded"]} in recording)
+    Throughput:  {report["jobs_per_min"]} jobs/min, {report["bytes_per_sec"]} bytes/s
+    Latency:     {report["latency"] or "-"}
+    Recorded:    {report["recorded_latency"] or "-"}
+    """)
 
 
 def main():
     """Main entry point."""
+    # Worker processes of the frozen exe re-enter here (workers > 1)
+    multiprocessing.freeze_support()
     if len(sys.argv) > 1:
         cmd = sys.argv[1].lower()
 
@@ -422,6 +4633,20 @@ def main():
             os.system(f"net start {SERVICE_NAME}")
         elif cmd == "console":
             run_console()
+        elif cmd == "profile":
+            run_console(profile=True)
+        elif cmd == "record":
+            if len(sys.argv) >= 3:
+                spool_bytes = int(sys.argv[3]) if len(sys.argv) >= 4 else 4096
+                run_console(trace=sys.argv[2], spool_bytes=spool_bytes)
+            else:
+                print("Usage: mirror_service.py record <trace.jsonl.gz> [spool_bytes]")
+        elif cmd == "replay":
+            if len(sys.argv) >= 3:
+                speed = float(sys.argv[3]) if len(sys.argv) >= 4 else 1.0
+                run_replay(sys.argv[2], speed)
+            else:
+                print("Usage: mirror_service.py replay <trace.jsonl.gz> [speed]")
         elif cmd == "config":
             if len(sys.argv) >= 4:
                 config = get_config()
@@ -437,12 +4662,50 @@ def main():
                 print(
                     "Usage: mirror_service.py config <source1,source2,...> <destination>"
                 )
+        elif cmd == "sniff":
+            for path in sys.argv[2:]:
+                with open(path, "rb") as f:
+                    spool_format = sniff_spool_format(f.read(SNIFF_BYTES))
+                datatype = SPOOL_DATATYPES[spool_format] or "(not mirrored)"
+                print(f"{path}: {spool_format} -> {datatype}")
+        elif cmd == "transform-bench":
+            size_mb = float(sys.argv[2]) if len(sys.argv) >= 3 else 16.0
+            results = benchmark_transform(size_mb)
+            base = results[0][1]
+            for name, ms_per_mb in results:
+                print(
+                    f"{name:<15} {ms_per_mb:7.2f} ms/MB "
+                    f"(+{ms_per_mb - base:.2f} ms/MB, {1000 / ms_per_mb:.0f} MB/s)"
+                )
         elif cmd == "status":
             config = get_config()
             print(f"Configuration ({CONFIG_PATH}):")
             print(f"  Source(s):   {', '.join(config['source_printers'])}")
             print(f"  Destination: {config['dest_printer']}")
+            print(f"  Fallback(s): {', '.join(config['fallback_printers']) or '-'}")
             print(f"  Interval:    {config['interval']}s")
+            for status_file in sorted(STATUS_PATH.parent.glob("status*.json")):
+                try:
+                    with open(status_file, "r") as f:
+                        status = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                age = time.time() - status["updated"]
+                print(f"Running mirror ({status_file.name}, updated {age:.0f}s ago):")
+                for printer, source in status["sources"].items():
+                    print(f"  {printer}: polling every {source['interval']}s")
+                depths = status.get("queue_depth", {})
+                for dest, state in status["destinations"].items():
+                    queued = f", {depths[dest]} queued" if dest in depths else ""
+                    print(f"  -> {dest}: {state}{queued}")
+                if status["metrics"].get("backlog"):
+                    print(f"  Held back: {status['metrics']['backlog']} job(s)")
+                slo = status.get("slo")
+                if slo and slo["state"] != "ok":
+                    print(f"  SLO VIOLATED: {slo['last_violation']}")
+                ha = status.get("ha")
+                if ha:
+                    print(f"  HA: {ha['node']} is {ha['role']} (leader: {ha['leader'] or '?'})")
         else:
             print(f"""
 {APP_NAME} - Service Manager
@@ -456,8 +4719,13 @@ Commands:
   stop        - Stop the service
   restart     - Restart the service
   console     - Run in console mode (for testing)
+  profile     - Run in console mode with CPU/memory profiling
+  record <trace> [bytes] - Run in console mode, recording traffic to a trace
+  replay <trace> [speed] - Replay a recorded trace offline (any OS)
   config <sources> <dest> - Configure printers (sources comma-separated)
   status      - Show current configuration
+  sniff <files> - Show the detected format of spool files
+  transform-bench [mb] - Measure the ESC/POS transform cost per MB
 
 Examples:
   {sys.argv[0]} config "PrinterOrg1,PrinterOrg2" "PrinterCopy"
@@ -0,0 +1,71 @@
+"""ESC/POS transform: command tokenizing, stripping and chunk boundaries."""
+
+from pathlib import Path
+
+import pytest
+
+from src.mirror_service import EscPosTransform, make_transform
+
+FIXTURES = Path(__file__).parent / "fixtures" / "spool"
+
+DRAWER = b"\x1bp\x00\x19\xfa"
+CUT = b"\x1dVA\x10"
+# 2 bytes wide, 2 rows; the pixel data contains ESC/GS bytes on purpose
+RASTER = b"\x1dv0\x00\x02\x00\x02\x00" + b"\x1b\x1d\x1bp"
+RECEIPT = b"\x1b@Espresso 2.50\n" + RASTER + b"Total 2.50\n" + DRAWER + CUT
+
+
+def run(transform, data: bytes, chunk_size: int = 0) -> bytes:
+    if chunk_size:
+        chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+    else:
+        chunks = [data]
+    return b"".join(transform(iter(chunks)))
+
+
+def test_plain_text_passes_through():
+    assert run(EscPosTransform(strip_drawer=False), b"Order 42\n") == b"Order 42\n"
+
+
+def test_drawer_kick_stripped_by_default():
+    out = run(EscPosTransform(), RECEIPT)
+    assert DRAWER not in out
+    assert CUT in out and RASTER in out
+
+
+def test_strip_cut_and_images():
+    out = run(EscPosTransform(strip_cut=True, strip_images=True), RECEIPT)
+    assert out == b"\x1b@Espresso 2.50\nTotal 2.50\n"
+
+
+def test_image_data_is_not_parsed_as_commands():
+    # The "ESC p" inside the raster data must survive drawer stripping
+    out = run(EscPosTransform(), RECEIPT)
+    assert out.count(b"\x1bp") == 1
+
+
+def test_copy_marker_after_initialize():
+    out = run(EscPosTransform(copy_marker="COPY"), RECEIPT)
+    assert out.startswith(b"\x1b@\x1ba\x01\x1bE\x01COPY\n")
+    assert out.count(b"COPY") == 1
+
+
+def test_drawer_pulse_realtime_command_stripped():
+    assert run(EscPosTransform(), b"A\x10\x14\x01\x00\x05B") == b"AB"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 7, 64])
+def test_chunk_boundaries_do_not_change_output(chunk_size):
+    transform = EscPosTransform(copy_marker="COPY", strip_cut=True, strip_images=True)
+    assert run(transform, RECEIPT, chunk_size) == run(transform, RECEIPT)
+
+
+def test_fixture_receipt():
+    data = (FIXTURES / "escpos.spl").read_bytes()
+    out = run(make_transform({"type": "escpos", "strip_cut": True}), data, 4)
+    assert out == data.replace(b"\x1dVA\x10", b"")
+
+
+def test_unknown_transform_type():
+    with pytest.raises(ValueError):
+        make_transform({"type": "pdf"})
@@ -0,0 +1,128 @@
+"""RawTcpSink against a localhost listener standing in for a printer."""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from src.mirror_service import RawTcpSink
+
+
+class FakePrinter:
+    """Accepts connections on localhost and records what each one received."""
+
+    def __init__(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.received = []  # one bytearray per accepted connection
+        self.connections = []
+        self._done = []
+        self.thread = threading.Thread(target=self._accept, daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            data = bytearray()
+            done = threading.Event()
+            self.received.append(data)
+            self.connections.append(conn)
+            self._done.append(done)
+            threading.Thread(target=self._read, args=(conn, data, done), daemon=True).start()
+
+    @staticmethod
+    def _read(conn, data, done):
+        try:
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                data.extend(chunk)
+        except OSError:
+            pass
+        done.set()
+
+    def wait_for(self, total: int, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while sum(len(d) for d in self.received) < total:
+            assert time.monotonic() < deadline, "printer did not receive the data"
+            time.sleep(0.01)
+
+    def wait_closed(self, index: int, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while len(self._done) <= index:
+            assert time.monotonic() < deadline, "no connection was made"
+            time.sleep(0.01)
+        assert self._done[index].wait(timeout), "connection was not closed"
+
+    def hang_up(self, index: int):
+        self.connections[index].shutdown(socket.SHUT_RDWR)
+        self.wait_closed(index)
+
+    def close(self):
+        self.server.close()
+        for conn in self.connections:
+            conn.close()
+
+
+@pytest.fixture
+def printer():
+    fake = FakePrinter()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def sink(printer):
+    sink = RawTcpSink("Printer", "127.0.0.1", printer.port, timeout=5.0)
+    yield sink
+    sink.close()
+
+
+def test_connection_reused_between_jobs(printer, sink):
+    assert sink.send("one", [b"JOB1-", b"PART2"]) == f"127.0.0.1:{printer.port}#1"
+    assert sink.send("two", [b"JOB2"]) == f"127.0.0.1:{printer.port}#2"
+    printer.wait_for(14)
+    assert len(printer.received) == 1
+    assert bytes(printer.received[0]) == b"JOB1-PART2JOB2"
+
+
+def test_reconnects_after_printer_closes(printer, sink):
+    sink.send("one", [b"JOB1"])
+    printer.wait_for(4)
+    printer.hang_up(0)
+    # Let the FIN reach the sink's socket
+    time.sleep(0.1)
+
+    sink.send("two", [b"JOB2"])
+    printer.wait_for(8)
+    assert [bytes(d) for d in printer.received] == [b"JOB1", b"JOB2"]
+
+
+def test_failed_send_drops_the_connection(printer, sink):
+    def broken_job():
+        yield b"PARTIAL"
+        raise OSError("spool file vanished")
+
+    with pytest.raises(OSError):
+        sink.send("broken", broken_job())
+    assert sink.sock is None
+    # The printer sees the partial job end, not the next job appended to it
+    printer.wait_closed(0)
+
+    sink.send("next", [b"JOB2"])
+    printer.wait_for(len(b"PARTIAL") + 4)
+    assert [bytes(d) for d in printer.received] == [b"PARTIAL", b"JOB2"]
+
+
+def test_idle_connection_is_replaced(printer, sink):
+    sink.idle_timeout = 0.0
+    sink.send("one", [b"JOB1"])
+    time.sleep(0.01)
+    sink.send("two", [b"JOB2"])
+    printer.wait_for(8)
+    assert len(printer.received) == 2
@@ -0,0 +1,184 @@
+"""Relay between sites: frame protocol, receiver handshake and resume."""
+
+import json
+import shutil
+import socket
+import subprocess
+import time
+import zlib
+
+import pytest
+
+from src.mirror_service import (
+    DEFAULT_CONFIG,
+    PrinterMirrorCore,
+    RelayReceiver,
+    RelaySink,
+    _recv_frame,
+    _send_frame,
+)
+
+TOKEN = "s3cret"
+
+
+@pytest.fixture
+def core(tmp_path):
+    config = {
+        **DEFAULT_CONFIG,
+        "source_printers": [],
+        "dest_printer": "Out",
+        "destinations": {"Out": {"type": "directory", "path": str(tmp_path / "out")}},
+    }
+    core = PrinterMirrorCore.from_config(config)
+    yield core
+    core.close()
+
+
+def start_receiver(core, tmp_path, **kwargs):
+    receiver = RelayReceiver(
+        core,
+        host="127.0.0.1",
+        port=0,
+        token=TOKEN,
+        state_path=tmp_path / "received.json",
+        dead_letter_dir=str(tmp_path / "dead"),
+        **kwargs,
+    )
+    receiver.start()
+    return receiver
+
+
+@pytest.fixture
+def receiver(core, tmp_path):
+    receiver = start_receiver(core, tmp_path)
+    yield receiver
+    receiver.stop()
+
+
+def make_sink(tmp_path, port, **kwargs):
+    options = {"site": "shop", "token": TOKEN, "linger": 0.01, "timeout": 5.0}
+    options.update(kwargs)
+    return RelaySink("HQ", "127.0.0.1", port, outbox=str(tmp_path / "outbox"), **options)
+
+
+def printed(tmp_path) -> list:
+    out = tmp_path / "out"
+    return sorted(p.read_bytes() for p in out.iterdir()) if out.exists() else []
+
+
+def wait_until(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def hello(port: int, token: str) -> tuple:
+    with socket.create_connection(("127.0.0.1", port), 5) as sock:
+        _send_frame(sock, b"H", json.dumps({"site": "shop", "token": token}).encode())
+        return _recv_frame(sock)
+
+
+def test_frame_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        payload = bytes(range(256)) * 32
+        _send_frame(left, b"B", payload)
+        _send_frame(left, b"P")
+        assert _recv_frame(right) == (b"B", payload)
+        assert _recv_frame(right) == (b"P", b"")
+
+
+def test_jobs_printed_in_order(tmp_path, receiver):
+    sink = make_sink(tmp_path, receiver.port)
+    try:
+        for i in range(3):
+            assert sink.send(f"doc{i}", [b"JOB%d" % i], "RAW", "Till", i) == f"relay #{i + 1}"
+        wait_until(lambda: not sink._pending())
+    finally:
+        sink.close()
+    assert printed(tmp_path) == [b"JOB0", b"JOB1", b"JOB2"]
+    assert receiver.state == {"shop": 3}
+
+
+def test_wrong_token_rejected(tmp_path, core, receiver):
+    assert hello(receiver.port, "guess") == (b"E", b"relay token rejected")
+    kind, payload = hello(receiver.port, TOKEN)
+    assert kind == b"A" and json.loads(payload) == {"seq": 0}
+
+    sink = make_sink(tmp_path, receiver.port, token="guess")
+    try:
+        sink.send("doc", [b"JOB"], "RAW", "Till", 1)
+        time.sleep(0.3)
+        assert sink.queue_depth() == 1
+    finally:
+        sink.close()
+    assert printed(tmp_path) == []
+
+
+def test_receiver_needs_a_token(core):
+    with pytest.raises(ValueError):
+        RelayReceiver(core, token="")
+
+
+def test_resend_after_lost_ack_not_printed_twice(tmp_path, core, receiver):
+    sink = make_sink(tmp_path, 1)  # nothing listens; the outbox just fills
+    try:
+        for i in range(3):
+            sink.send(f"doc{i}", [b"JOB%d" % i], "RAW", "Till", i)
+        _, batch = sink._batch(0)
+    finally:
+        sink.close()
+
+    assert receiver._print_batch("shop", batch) == 3
+    # The acknowledgement was lost; the sender resends the whole batch
+    assert receiver._print_batch("shop", batch) == 3
+    assert printed(tmp_path) == [b"JOB0", b"JOB1", b"JOB2"]
+
+    # A restarted sender is told where to resume
+    assert hello(receiver.port, TOKEN) == (b"A", b'{"seq": 3}')
+
+
+def test_decompressed_batch_over_limit_rejected(tmp_path, core):
+    receiver = start_receiver(core, tmp_path, max_batch_mb=0.01)
+    try:
+        with socket.create_connection(("127.0.0.1", receiver.port), 5) as sock:
+            _send_frame(sock, b"H", json.dumps({"site": "shop", "token": TOKEN}).encode())
+            assert _recv_frame(sock)[0] == b"A"
+            bomb = zlib.compress(b"\0" * (1024 * 1024))
+            assert len(bomb) < receiver.max_batch
+            _send_frame(sock, b"Z", bomb)
+            # The receiver drops the connection instead of inflating it
+            assert sock.recv(16) == b""
+    finally:
+        receiver.stop()
+    assert printed(tmp_path) == []
+
+
+@pytest.mark.skipif(shutil.which("openssl") is None, reason="needs openssl")
+def test_tls(tmp_path, core):
+    cert, key = tmp_path / "cert.pem", tmp_path / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=localhost", "-addext", "subjectAltName=IP:127.0.0.1",
+            "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True,
+        capture_output=True,
+    )
+    receiver = start_receiver(core, tmp_path, tls_cert=str(cert), tls_key=str(key))
+    try:
+        # Plain TCP gets nowhere
+        with pytest.raises((ConnectionError, OSError)):
+            hello(receiver.port, TOKEN)
+
+        sink = make_sink(tmp_path, receiver.port, tls=True, ca_file=str(cert))
+        try:
+            sink.send("doc", [b"SECRET JOB"], "RAW", "Till", 1)
+            wait_until(lambda: not sink._pending())
+        finally:
+            sink.close()
+    finally:
+        receiver.stop()
+    assert printed(tmp_path) == [b"SECRET JOB"]
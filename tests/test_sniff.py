@@ -0,0 +1,34 @@
+"""Spool format classification against recorded spool file headers."""
+
+from pathlib import Path
+
+import pytest
+
+from src.mirror_service import SNIFF_BYTES, SPOOL_DATATYPES, sniff_spool_format
+
+FIXTURES = Path(__file__).parent / "fixtures" / "spool"
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("emfspool.spl", "emf"),
+        ("emf-record.spl", "emf"),
+        ("xps.spl", "xps"),
+        ("pjl-pcl.spl", "pcl"),
+        ("pjl-postscript.spl", "postscript"),
+        ("postscript.spl", "postscript"),
+        ("pclxl.spl", "pcl"),
+        ("pcl5.spl", "pcl"),
+        ("escpos.spl", "escpos"),
+        ("text.spl", "raw"),
+    ],
+)
+def test_sniff_fixture(name, expected):
+    header = (FIXTURES / name).read_bytes()[:SNIFF_BYTES]
+    assert sniff_spool_format(header) == expected
+    assert expected in SPOOL_DATATYPES
+
+
+def test_sniff_empty_header_is_raw():
+    assert sniff_spool_format(b"") == "raw"